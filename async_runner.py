@@ -0,0 +1,194 @@
+import time
+import asyncio
+import metrics
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from feed_cache import get_feed_async, find_episode_title, HEADERS
+from downloader import download_episode_async
+from transcriber import transcribe
+from summarizer import summarize
+from utils import titles_to_relative_path
+from job_queue import (
+    STAGES,
+    worker_id,
+    claim_job,
+    renew_lease,
+    finish_stage,
+    fail_stage,
+    has_runnable_jobs
+)
+from config import (
+    HTTP_POOL_MAXSIZE,
+    HTTP_RETRIES,
+    ASYNC_PER_HOST_LIMIT,
+    PIPELINE_DOWNLOAD_WORKERS,
+    PIPELINE_TRANSCRIBE_WORKERS,
+    PIPELINE_SUMMARIZE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    QUEUE_LEASE_SECONDS
+)
+
+# Seconds to wait before checking an empty queue again
+IDLE_WAIT = 1
+
+class HostLimits:
+    """
+    One semaphore per host, so a batch never opens more than
+    ASYNC_PER_HOST_LIMIT concurrent requests to the same server.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphores = {}
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc.lower()
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.limit)
+        return self.semaphores[host]
+
+async def _fetch_feeds(client, limits, podcast_episodes):
+    """
+    Fetches every feed of the batch concurrently, each one once.
+    podcast_episodes maps each podcast URL to the episode URLs looked up
+    in its feed.
+    Returns {podcast_url: feed or None}.
+    """
+    async def fetch(url):
+        async with limits(url):
+            try:
+                return url, await get_feed_async(client, url, podcast_episodes[url])
+            except Exception as e:
+                print(f"Error fetching metadata for {url}: {e}")
+                return url, None
+
+    return dict(await asyncio.gather(*(fetch(url) for url in podcast_episodes)))
+
+def _relative_path(feed, episode_url):
+    if feed is None:
+        return titles_to_relative_path(None, None, episode_url)
+    episode_title = find_episode_title(feed, episode_url) or "Unknown Episode"
+    return titles_to_relative_path(feed["title"], episode_title, episode_url)
+
+def _claim_all(owner):
+    jobs = []
+    while True:
+        job = claim_job(STAGES, owner)
+        if job is None:
+            return jobs
+        jobs.append(job)
+
+async def _renew_leases(jobs, owner):
+    # Queue calls run in a thread: with a remote queue they are blocking
+    # HTTP requests that would stall every download on the loop
+    while True:
+        await asyncio.sleep(QUEUE_LEASE_SECONDS / 3)
+        for job in list(jobs):
+            try:
+                await asyncio.to_thread(renew_lease, job, owner)
+            except Exception as e:
+                # e.g. the queue node restarting; try again next beat
+                print(f"⚠️ Could not renew lease on {job['episode_url']}: {e}")
+
+async def run_batch_async():
+    """
+    Claims every runnable job of the queue and processes them on an
+    asyncio event loop.
+
+    All feeds of the batch are fetched concurrently, downloads are streamed
+    with httpx under per-host limits, and transcription and summaries run
+    in thread pools so whisper and LLM calls never block the network work.
+    At most PIPELINE_DOWNLOAD_WORKERS + PIPELINE_QUEUE_SIZE episodes are
+    downloaded ahead of transcription.
+    """
+    owner = worker_id()
+    jobs = _claim_all(owner)
+    if not jobs:
+        return
+    active = list(jobs)
+
+    loop = asyncio.get_running_loop()
+    limits = HostLimits(ASYNC_PER_HOST_LIMIT)
+    ahead = asyncio.Semaphore(PIPELINE_DOWNLOAD_WORKERS + PIPELINE_QUEUE_SIZE)
+    downloading = asyncio.Semaphore(PIPELINE_DOWNLOAD_WORKERS)
+    url_locks = {}
+
+    transport = httpx.AsyncHTTPTransport(retries=HTTP_RETRIES)
+    client_limits = httpx.Limits(max_connections=None, max_keepalive_connections=HTTP_POOL_MAXSIZE)
+    renewer = asyncio.create_task(_renew_leases(active, owner))
+
+    async def run_stage(job, stage_coro):
+        """
+        Runs one stage and records it in the queue.
+        Returns the artifact, or None if the stage failed.
+        """
+        start = time.time()
+        try:
+            result = await stage_coro
+            error = None if result else f"{job['stage']} returned no result"
+        except Exception as e:
+            result, error = None, e
+
+        duration = time.time() - start
+        metrics.record_stage(job, duration, error)
+        if error is not None:
+            await asyncio.to_thread(fail_stage, job, owner, error)
+            active.remove(job)
+            return None
+        await asyncio.to_thread(finish_stage, job, owner, result, duration, keep_lease=True)
+        index = STAGES.index(job["stage"])
+        if index + 1 < len(STAGES):
+            job.update(stage=STAGES[index + 1], artifact=result, attempts=1)
+        else:
+            active.remove(job)
+        return result
+
+    with ThreadPoolExecutor(PIPELINE_TRANSCRIBE_WORKERS, thread_name_prefix="transcribe") as transcribe_pool, \
+         ThreadPoolExecutor(PIPELINE_SUMMARIZE_WORKERS, thread_name_prefix="summarize") as summarize_pool:
+        async with httpx.AsyncClient(headers=HEADERS, transport=transport, limits=client_limits, follow_redirects=True) as client:
+            podcast_episodes = {}
+            for job in jobs:
+                if job["stage"] == "download" and job["podcast_url"]:
+                    podcast_episodes.setdefault(job["podcast_url"], []).append(job["episode_url"])
+            feeds = await _fetch_feeds(client, limits, podcast_episodes)
+
+            async def download(job):
+                episode_url = job["episode_url"]
+                relative_path = _relative_path(feeds.get(job["podcast_url"]), episode_url)
+                lock = url_locks.setdefault(episode_url, asyncio.Lock())
+                async with lock, downloading, limits(episode_url):
+                    return await download_episode_async(client, episode_url, relative_path)
+
+            async def process(job):
+                # Jobs resume at whatever stage they stopped
+                if job["stage"] == "download":
+                    async with ahead:
+                        if not await run_stage(job, download(job)):
+                            return
+                        await run_stage(job, loop.run_in_executor(transcribe_pool, transcribe, job["artifact"]))
+                elif job["stage"] == "transcribe":
+                    await run_stage(job, loop.run_in_executor(transcribe_pool, transcribe, job["artifact"]))
+
+                if job["stage"] == "summarize" and job in active:
+                    await run_stage(job, loop.run_in_executor(summarize_pool, summarize, job["artifact"]))
+
+            results = await asyncio.gather(*(process(job) for job in jobs), return_exceptions=True)
+            for job, result in zip(jobs, results):
+                if isinstance(result, Exception):
+                    print(f"❌ Failed to process {job['episode_url']}: {result}")
+
+    renewer.cancel()
+
+def run_batch():
+    asyncio.run(run_batch_async())
+
+def run_batches_forever():
+    """
+    Keeps processing the queue in batches as jobs become runnable.
+    """
+    while True:
+        if has_runnable_jobs():
+            run_batch()
+        else:
+            time.sleep(IDLE_WAIT)
@@ -0,0 +1,284 @@
+"""
+Re-transcribes or re-summarizes the existing archive, e.g. after a change
+of whisper model or prompt:
+
+    python backfill.py summarize --dry-run
+    python backfill.py summarize --podcast "Some Podcast" --since 2024-01-01
+    python backfill.py transcribe --model base --workers 2
+
+By default only stale artifacts are redone: missing ones, ones made by
+another model or prompt, ones without a provenance record, and summaries
+older than their transcript. An interrupted run picks up where it stopped
+when it is started again with the same options.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+from functools import partial
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import search
+import provenance
+import content_store
+import transcriber
+import summarizer
+import llm_cache
+import whisper_server
+from map_reduce import estimate_tokens
+from config import (
+    DOWNLOAD_DIR,
+    TRANSCRIPT_DIR,
+    SUMMARY_DIR,
+    WHISPER_MODEL,
+    WHISPER_BACKEND,
+    WHISPER_SERVER_PORT,
+    LLM_PROVIDER,
+    GEMINI_BATCH_ENABLED,
+    MAP_REDUCE_ENABLED,
+    MAP_REDUCE_CHUNK_TOKENS,
+    PIPELINE_TRANSCRIBE_WORKERS,
+    PIPELINE_SUMMARIZE_WORKERS,
+    BACKFILL_DIR
+)
+
+# Provenance value of artifacts made before provenance was recorded
+UNKNOWN = "unknown"
+
+def _views(root, suffix=""):
+    """
+    Yields (path, podcast) for the readable files under root.
+    """
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.endswith(suffix) and not name.endswith((".part", ".tmp")):
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, root)
+                podcast = rel.split(os.sep, 1)[0] if os.sep in rel else None
+                yield path, podcast
+
+def _date(path):
+    # When the view was created, i.e. when the episode was processed
+    return datetime.fromtimestamp(os.lstat(path).st_mtime).date()
+
+def transcribe_work():
+    """
+    Yields (audio view, transcript view, transcript target, podcast, date, reasons)
+    for every downloaded episode.
+    """
+    for audio, podcast in _views(DOWNLOAD_DIR):
+        if not os.path.exists(audio):
+            continue
+        rel = os.path.relpath(audio, DOWNLOAD_DIR)
+        view = os.path.join(TRANSCRIPT_DIR, rel + ".txt")
+        content = content_store.content_hash(audio)
+        target = content_store.transcript_path(content) if content else view
+        model = provenance.read(target).get("model", UNKNOWN) if os.path.exists(target) else None
+        reasons = []
+        if model is None:
+            reasons.append("missing")
+        elif model != WHISPER_MODEL:
+            reasons.append(f"model {model}")
+        yield {"source": audio, "view": view, "target": target, "podcast": podcast,
+               "date": _date(audio), "model": model, "prompt": None, "reasons": reasons}
+
+def summarize_work():
+    """
+    Same for every transcript.
+    """
+    current_model = llm_cache.model_name()
+    for transcript, podcast in _views(TRANSCRIPT_DIR, ".txt"):
+        if not os.path.exists(transcript):
+            continue
+        rel = os.path.relpath(transcript, TRANSCRIPT_DIR)[:-len(".txt")]
+        view = os.path.join(SUMMARY_DIR, rel + ".md")
+        content = content_store.content_hash(transcript)
+        target = content_store.summary_path(content) if content else view
+
+        with open(transcript, "r", encoding="utf-8", errors="replace") as f:
+            long_transcript = MAP_REDUCE_ENABLED and estimate_tokens(f.read()) > MAP_REDUCE_CHUNK_TOKENS
+        templates = summarizer.summary_templates(long_transcript)
+        current_prompt = provenance.prompt_version("\0".join(templates)) if None not in templates else None
+
+        reasons = []
+        model = prompt = None
+        if not os.path.exists(target):
+            reasons.append("missing")
+        else:
+            meta = provenance.read(target)
+            model, prompt = meta.get("model", UNKNOWN), meta.get("prompt", UNKNOWN)
+            if meta.get("provider", LLM_PROVIDER) != LLM_PROVIDER or model != current_model:
+                reasons.append(f"model {model}")
+            if prompt != current_prompt:
+                reasons.append(f"prompt {prompt}")
+            if os.path.getmtime(target) < os.path.getmtime(transcript):
+                reasons.append("older than transcript")
+        yield {"source": transcript, "view": view, "target": target, "podcast": podcast,
+               "date": _date(transcript), "model": model, "prompt": prompt, "reasons": reasons}
+
+def select(work, args):
+    for item in work:
+        if args.podcast and item["podcast"] not in args.podcast:
+            continue
+        if args.since and item["date"] < args.since:
+            continue
+        if args.until and item["date"] > args.until:
+            continue
+        if args.model and item["model"] != args.model:
+            continue
+        if args.prompt and item["prompt"] != args.prompt:
+            continue
+        if args.force or args.model or args.prompt or item["reasons"]:
+            yield item
+
+def redo_transcript(item, threads=None):
+    """
+    Runs in a worker, with threads whisper threads. Returns the transcript
+    path or None.
+    """
+    label = os.path.relpath(item["source"], DOWNLOAD_DIR)
+    old_segments = item["target"][:-len(".txt")] + ".seg"
+    old_mtime = os.path.getmtime(old_segments) if os.path.exists(old_segments) else None
+    transcript = transcriber.run_whisper(os.path.realpath(item["source"]), item["target"][:-len(".txt")], label, threads)
+    if not transcript:
+        return None
+    # Segments of the old transcript that weren't rewritten no longer match it
+    if old_mtime is not None and os.path.exists(old_segments) and os.path.getmtime(old_segments) == old_mtime:
+        os.remove(old_segments)
+    view = content_store.link_view(transcript, item["view"]) if transcript != item["view"] else transcript
+    search.index_transcript(view)
+    return transcript
+
+def redo_summary(item):
+    """
+    Runs in a worker. Returns the summary path or None.
+    """
+    if not summarizer.write_summary(item["source"], item["target"]):
+        return None
+    view = content_store.link_view(item["target"], item["view"]) if item["target"] != item["view"] else item["target"]
+    search.index_summary(view)
+    return item["target"]
+
+def adopt(item, stage):
+    """
+    Records the current settings as the provenance of an existing artifact
+    that has none, without redoing it.
+    """
+    if stage == "transcribe":
+        provenance.record(item["target"], model=WHISPER_MODEL)
+        return
+    with open(item["source"], "r", encoding="utf-8", errors="replace") as f:
+        long_transcript = MAP_REDUCE_ENABLED and estimate_tokens(f.read()) > MAP_REDUCE_CHUNK_TOKENS
+    templates = summarizer.summary_templates(long_transcript)
+    if None not in templates:
+        provenance.record(item["target"], provider=LLM_PROVIDER, model=llm_cache.model_name(),
+                          prompt=provenance.prompt_version("\0".join(templates)))
+
+def _progress_path(args):
+    """
+    Progress of a run is kept per stage and selection, so a run started
+    again with the same options resumes.
+    """
+    key = repr([args.stage, sorted(args.podcast or []), str(args.since), str(args.until),
+                args.model, args.prompt, args.force])
+    return os.path.join(BACKFILL_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest()[:16] + ".done")
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def run(items, args):
+    progress = _progress_path(args)
+    done = set()
+    if os.path.exists(progress):
+        with open(progress, "r", encoding="utf-8") as f:
+            done = set(f.read().splitlines())
+    todo = [item for item in items if item["target"] not in done]
+    if done:
+        print(f"Resuming: {len(items) - len(todo)} of {len(items)} already done")
+    if not todo:
+        return 0
+
+    redo = redo_transcript if args.stage == "transcribe" else redo_summary
+    workers = args.workers or (PIPELINE_TRANSCRIBE_WORKERS if args.stage == "transcribe" else PIPELINE_SUMMARIZE_WORKERS)
+    if args.stage == "transcribe":
+        # The cores are split between this run's workers, not the pipeline's
+        redo = partial(redo_transcript, threads=transcriber.whisper_threads(workers))
+    executor = ProcessPoolExecutor
+    if args.stage == "transcribe" and WHISPER_BACKEND == "server":
+        # One pool of whisper servers for all workers, on the ports after the
+        # running service's, stopped again when this process exits
+        whisper_server.configure_pool(WHISPER_SERVER_PORT + PIPELINE_TRANSCRIBE_WORKERS, workers)
+        executor = ThreadPoolExecutor
+    if args.stage == "summarize" and LLM_PROVIDER == "gemini" and GEMINI_BATCH_ENABLED:
+        # All prompts must reach the same batcher to be sent as one batch
+        executor = ThreadPoolExecutor
+    os.makedirs(BACKFILL_DIR, exist_ok=True)
+    failed = 0
+    started = time.time()
+    with open(progress, "a", encoding="utf-8") as log, executor(max_workers=workers) as pool:
+        futures = {pool.submit(redo, item): item for item in todo}
+        for finished, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error processing {item['source']}: {e}")
+                result = None
+            if result:
+                log.write(item["target"] + "\n")
+                log.flush()
+            else:
+                failed += 1
+            elapsed = time.time() - started
+            eta = elapsed / finished * (len(todo) - finished)
+            print(f"⏳ [{finished}/{len(todo)}] {os.path.basename(item['view'])} "
+                  f"{'done' if result else 'FAILED'}, ETA {_format_eta(eta)}")
+
+    if failed:
+        print(f"⚠️ {failed} of {len(todo)} failed. Run the same command again to retry them.")
+    else:
+        os.remove(progress)
+        print(f"✅ Redid {len(todo)} {'transcripts' if args.stage == 'transcribe' else 'summaries'} in {_format_eta(time.time() - started)}")
+    return 1 if failed else 0
+
+def _date_arg(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Redo transcripts or summaries of the existing archive")
+    parser.add_argument("stage", choices=("transcribe", "summarize"))
+    parser.add_argument("--podcast", action="append", help="Only this podcast (directory name); repeatable")
+    parser.add_argument("--since", type=_date_arg, help="Only episodes processed on or after YYYY-MM-DD")
+    parser.add_argument("--until", type=_date_arg, help="Only episodes processed on or before YYYY-MM-DD")
+    parser.add_argument("--model", help=f"Redo artifacts made by this model ('{UNKNOWN}' for unrecorded ones)")
+    parser.add_argument("--prompt", help=f"Redo summaries made with this prompt version ('{UNKNOWN}' for unrecorded ones)")
+    parser.add_argument("--force", action="store_true", help="Redo everything selected, stale or not")
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes, or threads for whisper servers and Gemini batches (default: the pipeline's workers for the stage)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be redone")
+    parser.add_argument("--adopt", action="store_true",
+                        help="Record the current model and prompt for existing artifacts without provenance, instead of redoing them")
+    args = parser.parse_args(argv)
+
+    work = transcribe_work() if args.stage == "transcribe" else summarize_work()
+    items = list(select(work, args))
+
+    if args.adopt:
+        adopted = [item for item in items if item["reasons"] and item["model"] == UNKNOWN]
+        for item in adopted:
+            adopt(item, args.stage)
+        print(f"Recorded provenance of {len(adopted)} existing artifacts")
+        return 0
+
+    print(f"{len(items)} {'episodes to transcribe' if args.stage == 'transcribe' else 'transcripts to summarize'}")
+    if args.dry_run:
+        for item in items:
+            reasons = ", ".join(item["reasons"]) or "forced"
+            print(f"  {os.path.relpath(item['view'])} ({reasons})")
+        return 0
+    return run(items, args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Stand-ins for whisper-cli, ffmpeg and ffprobe, called by the wrapper
+scripts of the benchmark as: fake_tools.py <tool> <args...>
+
+The benchmark audio is already 16kHz mono WAV, so "ffmpeg" only copies it.
+"whisper-cli" sleeps for the audio duration times PODGIST_BENCH_WHISPER_RTF
+and writes a transcript of PODGIST_BENCH_WORDS_PER_SECOND words per second.
+"""
+import io
+import os
+import json
+import sys
+import time
+import wave
+import shutil
+
+def _arg(args, flag, default=None):
+    if flag in args and args.index(flag) + 1 < len(args):
+        return args[args.index(flag) + 1]
+    return default
+
+def _duration(source):
+    with wave.open(source, 'rb') as w:
+        return w.getnframes() / float(w.getframerate())
+
+def ffmpeg(args):
+    source, output = _arg(args, "-i"), args[-1]
+    if "null" in args:
+        # Filters like silencedetect: nothing to report
+        return 0
+    if "-ss" in args:
+        # Cutting a chunk for chunked transcription
+        with wave.open(source, 'rb') as src, wave.open(output, 'wb') as dst:
+            rate = src.getframerate()
+            dst.setparams(src.getparams())
+            src.setpos(min(src.getnframes(), int(float(_arg(args, "-ss")) * rate)))
+            dst.writeframes(src.readframes(int(float(_arg(args, "-t")) * rate)))
+    elif output == "-":
+        with open(source, 'rb') as f:
+            shutil.copyfileobj(f, sys.stdout.buffer)
+    else:
+        shutil.copyfile(source, output)
+    return 0
+
+def ffprobe(args):
+    print(_duration(args[-1]))
+    return 0
+
+def whisper(args):
+    source, output_base = _arg(args, "-f"), _arg(args, "-of")
+    if source == "-":
+        source = io.BytesIO(sys.stdin.buffer.read())
+    duration = _duration(source)
+
+    time.sleep(duration * float(os.environ.get("PODGIST_BENCH_WHISPER_RTF", "0.01")))
+    words = int(duration * float(os.environ.get("PODGIST_BENCH_WORDS_PER_SECOND", "2.5")))
+    sentences = [" ".join(["word"] * 11) + "." for _ in range(words // 12 + 1)]
+    with open(output_base + ".txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(sentences) + "\n")
+    if "-oj" in args:
+        step = duration / len(sentences)
+        transcription = [
+            {"offsets": {"from": int(i * step * 1000), "to": int((i + 1) * step * 1000)}, "text": " " + sentence}
+            for i, sentence in enumerate(sentences)
+        ]
+        with open(output_base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"transcription": transcription}, f)
+    return 0
+
+TOOLS = {
+    "ffmpeg": ffmpeg,
+    "ffprobe": ffprobe,
+    "whisper-cli": whisper
+}
+
+if __name__ == "__main__":
+    sys.exit(TOOLS[sys.argv[1]](sys.argv[2:]))
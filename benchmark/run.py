@@ -0,0 +1,221 @@
+"""
+Offline benchmark of the whole pipeline.
+
+Starts local stand-ins for gPodder, the RSS feeds, the audio host and
+Ollama, puts stub ffmpeg/ffprobe/whisper-cli binaries on the PATH, and
+runs PodGist against synthetic backlogs of increasing size. Each run is
+a fresh process with its own data directory and config, so pipeline or
+caching changes can be compared on a machine with no network.
+
+    python -m benchmark.run --plays 1,10,100,1000
+    python -m benchmark.run --plays 100 --engine async --bandwidth 2000000
+    python -m benchmark.run --plays 100 --set pipeline.download_workers=4
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOOLS = os.path.join(REPO_DIR, "benchmark", "fake_tools.py")
+STAGES = ("download", "transcribe", "summarize")
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def summarize_times(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values)
+    }
+
+def worker(engine):
+    """
+    Runs inside the benchmark process: polls the stand-in gPodder once,
+    drains the queue and writes result.json with the timings.
+    """
+    sys.path.insert(0, REPO_DIR)
+    import main
+    import state_manager
+
+    started = time.time()
+    main.enqueue_new_plays(0)
+    polled = time.time()
+
+    if engine == "async":
+        from async_runner import run_batch
+        while state_manager.has_runnable_jobs():
+            run_batch()
+    else:
+        from pipeline import run_pipeline
+        run_pipeline()
+    finished = time.time()
+
+    rows = state_manager._connect().execute(
+        "SELECT status, timings, created_at, updated_at FROM jobs"
+    ).fetchall()
+    stages = {stage: [] for stage in STAGES}
+    end_to_end = []
+    for row in rows:
+        for stage, seconds in json.loads(row["timings"]).items():
+            stages[stage].append(seconds)
+        if row["status"] == "done":
+            end_to_end.append(row["updated_at"] - row["created_at"])
+
+    result = {
+        "jobs": len(rows),
+        "done": sum(1 for row in rows if row["status"] == "done"),
+        "failed": sum(1 for row in rows if row["status"] == "failed"),
+        "poll_seconds": polled - started,
+        "wall_seconds": finished - started,
+        "end_to_end": summarize_times(end_to_end),
+        "stages": {stage: summarize_times(values) for stage, values in stages.items()}
+    }
+    with open("result.json", "w") as f:
+        json.dump(result, f)
+
+def _set(config, key_path, raw):
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    keys = key_path.split(".")
+    for key in keys[:-1]:
+        config = config.setdefault(key, {})
+    config[keys[-1]] = value
+
+def make_config(args, base_url, work_dir, bin_dir):
+    config = {
+        "gpodder": {"base_url": base_url, "since_timestamp": 0},
+        "paths": {
+            "models": os.path.join(work_dir, "models"),
+            "prompt_file": os.path.join(REPO_DIR, "prompt.md"),
+            "chunk_prompt_file": os.path.join(REPO_DIR, "prompt_chunk.md"),
+            "reduce_prompt_file": os.path.join(REPO_DIR, "prompt_reduce.md")
+        },
+        "llm": {"provider": "ollama", "ollama": {"base_url": base_url, "model": "bench"}},
+        "whisper": {"model": "bench", "bin_path": os.path.join(bin_dir, "whisper-cli")},
+        "queue": {"max_attempts": 1},
+        "pipeline": {"engine": args.engine}
+    }
+    for override in args.set:
+        key_path, _, raw = override.partition("=")
+        _set(config, key_path, raw)
+    return config
+
+def make_bin_dir(root):
+    """
+    Creates ffmpeg, ffprobe and whisper-cli wrappers around fake_tools.py.
+    """
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir)
+    for name in ("ffmpeg", "ffprobe", "whisper-cli"):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOLS}" {name} "$@"\n')
+        os.chmod(path, 0o755)
+    return bin_dir
+
+def run_backlog(args, backlog, base_url, root, bin_dir, plays):
+    """
+    Runs one benchmark process over a backlog of plays and returns its result.
+    """
+    work_dir = os.path.join(root, f"run-{plays}")
+    os.makedirs(os.path.join(work_dir, "models"))
+    config = make_config(args, base_url, work_dir, bin_dir)
+    # The stub whisper ignores the model, it only has to exist
+    open(os.path.join(work_dir, "models", "ggml-bench.bin"), "w").close()
+    # YAML is a superset of JSON
+    with open(os.path.join(work_dir, "config.yaml"), "w") as f:
+        json.dump(config, f, indent=2)
+
+    backlog.plays = plays
+    env = dict(
+        os.environ,
+        PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        PYTHONPATH=REPO_DIR,
+        GPODDER_USERNAME="bench",
+        GPODDER_PASSWORD="bench",
+        PODGIST_BENCH_WHISPER_RTF=str(args.whisper_rtf)
+    )
+    with open(os.path.join(work_dir, "podgist.log"), "w") as log:
+        subprocess.run(
+            [sys.executable, "-m", "benchmark.run", "--worker", "--engine", args.engine],
+            cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT, check=True
+        )
+    with open(os.path.join(work_dir, "result.json")) as f:
+        return json.load(f)
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds:.3f}"
+
+def report(plays, result):
+    wall = result["wall_seconds"]
+    print(f"\n{plays} plays: {result['done']} done, {result['failed']} failed "
+          f"in {wall:.2f}s ({result['done'] / wall if wall else 0:.2f} episodes/s, poll {result['poll_seconds']:.2f}s)")
+    print(f"  {'':<12}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    rows = [("end-to-end", result["end_to_end"])] + [(s, result["stages"][s]) for s in STAGES]
+    for name, stats in rows:
+        print(f"  {name:<12}{stats['count']:>7}{_fmt(stats.get('mean')):>10}{_fmt(stats.get('p50')):>10}"
+              f"{_fmt(stats.get('p95')):>10}{_fmt(stats.get('max')):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline PodGist benchmark")
+    parser.add_argument("--plays", default="1,10,100", help="Comma-separated backlog sizes (default 1,10,100)")
+    parser.add_argument("--engine", default="threads", choices=("threads", "async"))
+    parser.add_argument("--podcasts", type=int, default=10, help="Podcasts the plays are spread over")
+    parser.add_argument("--feed-items", type=int, default=100, help="Items per RSS feed")
+    parser.add_argument("--audio-seconds", type=int, default=10, help="Duration of each episode (32 KB per second)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Audio bytes/s per connection (default unlimited)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake Ollama request")
+    parser.add_argument("--whisper-rtf", type=float, default=0.01, help="Stub whisper seconds per audio second")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config.yaml key, e.g. pipeline.download_workers=4")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the data directories of the runs")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.engine)
+        return
+
+    from benchmark import servers
+
+    server, backlog = servers.start(
+        dict(podcasts=args.podcasts, feed_items=args.feed_items, audio_seconds=args.audio_seconds),
+        bandwidth=args.bandwidth,
+        llm_latency=args.llm_latency
+    )
+    root = tempfile.mkdtemp(prefix="podgist-bench-")
+    bin_dir = make_bin_dir(root)
+    print(f"🏁 Benchmarking the {args.engine} engine against stand-ins at {backlog.base_url} (data in {root})")
+
+    results = {}
+    try:
+        for plays in [int(p) for p in args.plays.split(",") if p.strip()]:
+            results[plays] = run_backlog(args, backlog, backlog.base_url, root, bin_dir, plays)
+            report(plays, results[plays])
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Local stand-ins for the services PodGist talks to, so the pipeline can be
+benchmarked without a network: gPodder, RSS feeds, an audio CDN and Ollama.
+All of them run in one ThreadingHTTPServer.
+"""
+import re
+import json
+import time
+import struct
+import threading
+from email.utils import formatdate
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 16kHz mono 16-bit PCM, what whisper expects
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+SEND_CHUNK = 65536
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+class Backlog:
+    """
+    The synthetic world served by the stand-ins: podcasts with feeds of
+    feed_items episodes each, and the plays gPodder reports.
+    """
+
+    def __init__(self, base_url, plays=0, podcasts=10, feed_items=100, audio_seconds=10):
+        self.base_url = base_url
+        self.podcasts = podcasts
+        self.feed_items = feed_items
+        self.audio_seconds = audio_seconds
+        self.plays = plays
+        self.timestamp = int(time.time())
+
+    def feed_url(self, podcast):
+        return f"{self.base_url}/feeds/{podcast}.xml"
+
+    def episode_url(self, podcast, episode):
+        return f"{self.base_url}/audio/{podcast}/{episode}.wav"
+
+    def played(self):
+        """
+        Plays are spread over the podcasts; play i is the (i // podcasts)-th
+        episode of podcast i % podcasts.
+        """
+        return [(i % self.podcasts, i // self.podcasts) for i in range(self.plays)]
+
+    def actions(self):
+        actions = []
+        for i, (podcast, episode) in enumerate(self.played()):
+            actions.append({
+                "podcast": self.feed_url(podcast),
+                "episode": self.episode_url(podcast, episode),
+                "action": "play",
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.timestamp - self.plays + i)),
+                "position": self.audio_seconds,
+                "total": self.audio_seconds
+            })
+        return actions
+
+    def feed(self, podcast):
+        items = max(self.feed_items, -(-self.plays // self.podcasts))
+        parts = [f"<?xml version='1.0' encoding='UTF-8'?>\n<rss version='2.0'><channel><title>Podcast {podcast}</title>"]
+        for episode in range(items):
+            url = self.episode_url(podcast, episode)
+            size = 44 + self.audio_seconds * BYTES_PER_SECOND
+            parts.append(
+                f"<item><title>Episode {episode}</title><guid>{url}</guid>"
+                f"<enclosure url='{url}' length='{size}' type='audio/wav'/>"
+                f"<description>{'Lorem ipsum dolor sit amet. ' * 20}</description></item>"
+            )
+        parts.append("</channel></rss>")
+        return "".join(parts).encode("utf-8")
+
+    def audio(self, podcast, episode):
+        """
+        A silent WAV whose first samples encode the episode, so every
+        episode has different content (and a different hash in the store).
+        """
+        data = bytearray(self.audio_seconds * BYTES_PER_SECOND)
+        data[:8] = struct.pack("<II", podcast, episode)
+        header = struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + len(data), b"WAVE", b"fmt ", 16, 1, 1,
+            SAMPLE_RATE, BYTES_PER_SECOND, 2, 16, b"data", len(data)
+        )
+        return header + bytes(data)
+
+def _handler(backlog, bandwidth, llm_latency, llm_response_words):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._serve(head=False)
+
+        def do_HEAD(self):
+            self._serve(head=True)
+
+        def do_POST(self):
+            if urlsplit(self.path).path != "/api/generate":
+                self._reply(404, b"")
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            words = ["summary"] * llm_response_words
+            if not request.get("stream", True):
+                time.sleep(llm_latency)
+                self._reply(200, json.dumps({"response": " ".join(words), "done": True}).encode("utf-8"), "application/json")
+                return
+
+            # Streamed as NDJSON: half of the latency before the first word,
+            # the rest spread over the response
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            time.sleep(llm_latency / 2)
+            for word in words:
+                self.wfile.write(json.dumps({"response": word + " ", "done": False}).encode("utf-8") + b"\n")
+                self.wfile.flush()
+                time.sleep(llm_latency / 2 / len(words))
+            self.wfile.write(json.dumps({"response": "", "done": True}).encode("utf-8") + b"\n")
+
+        def _serve(self, head):
+            parts = urlsplit(self.path)
+            path = parts.path.strip("/").split("/")
+
+            if parts.path.startswith("/api/2/episodes/"):
+                body = json.dumps({"actions": backlog.actions(), "timestamp": backlog.timestamp}).encode("utf-8")
+                since = int(parse_qs(parts.query).get("since", ["0"])[0])
+                if since >= backlog.timestamp:
+                    body = json.dumps({"actions": [], "timestamp": backlog.timestamp}).encode("utf-8")
+                self._reply(200, body, "application/json", head=head)
+            elif path[0] == "feeds" and len(path) == 2:
+                podcast = int(path[1].split(".")[0])
+                etag = f'"feed-{podcast}-{backlog.plays}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._reply(304, b"", head=True, extra={"ETag": etag})
+                    return
+                self._reply(200, backlog.feed(podcast), "application/rss+xml", head=head, extra={"ETag": etag})
+            elif path[0] == "audio" and len(path) == 3:
+                self._audio(int(path[1]), int(path[2].split(".")[0]), head)
+            else:
+                self._reply(404, b"", head=head)
+
+        def _audio(self, podcast, episode, head):
+            data = backlog.audio(podcast, episode)
+            etag = f'"audio-{podcast}-{episode}"'
+            extra = {"ETag": etag, "Accept-Ranges": "bytes", "Last-Modified": formatdate(0, usegmt=True)}
+
+            match = _RANGE_RE.fullmatch(self.headers.get("Range", ""))
+            if_range = self.headers.get("If-Range")
+            if match and (not if_range or if_range == etag):
+                start = int(match.group(1) or 0)
+                end = int(match.group(2)) if match.group(2) else len(data) - 1
+                if start >= len(data):
+                    self._reply(416, b"", head=head, extra={"Content-Range": f"bytes */{len(data)}"})
+                    return
+                end = min(end, len(data) - 1)
+                extra["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                self._reply(206, data[start:end + 1], "audio/wav", head=head, extra=extra, throttle=True)
+            else:
+                self._reply(200, data, "audio/wav", head=head, extra=extra, throttle=True)
+
+        def _reply(self, status, body, content_type="text/plain", head=False, extra=None, throttle=False):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (extra or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if head or not body:
+                return
+            if not throttle or not bandwidth:
+                self.wfile.write(body)
+                return
+            # Per-connection bandwidth limit
+            for offset in range(0, len(body), SEND_CHUNK):
+                started = time.time()
+                chunk = body[offset:offset + SEND_CHUNK]
+                self.wfile.write(chunk)
+                time.sleep(max(0, len(chunk) / bandwidth - (time.time() - started)))
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+def start(backlog_kwargs, bandwidth=None, llm_latency=0.0, llm_response_words=200, host="127.0.0.1"):
+    """
+    Starts the stand-ins on a free port.
+    Returns (server, backlog); set backlog.plays to change the next backlog.
+    """
+    server = ThreadingHTTPServer((host, 0), None)
+    server.daemon_threads = True
+    backlog = Backlog(f"http://{host}:{server.server_address[1]}", **backlog_kwargs)
+    server.RequestHandlerClass = _handler(backlog, bandwidth, llm_latency, llm_response_words)
+    threading.Thread(target=server.serve_forever, name="stand-ins", daemon=True).start()
+    return server, backlog
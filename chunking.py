@@ -0,0 +1,167 @@
+import re
+import wave
+import bisect
+import subprocess
+
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+def wav_duration(path):
+    """
+    Returns the duration of a WAV file in seconds.
+    """
+    with wave.open(path, 'rb') as w:
+        return w.getnframes() / float(w.getframerate())
+
+def media_duration(path):
+    """
+    Returns the duration of any audio file in seconds using ffprobe,
+    or None if it cannot be determined.
+    """
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path]
+    try:
+        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def detect_silences(path, noise_db, min_duration):
+    """
+    Finds silent stretches with ffmpeg's silencedetect filter.
+    Returns a list of (start, end) tuples in seconds.
+    """
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostats",
+        "-i", path,
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_duration}",
+        "-f", "null",
+        "-"
+    ]
+    result = subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    silences = []
+    start = None
+    for kind, value in _SILENCE_RE.findall(result.stderr):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+def plan_chunks(duration, silences, count):
+    """
+    Splits [0, duration] into up to count chunks of similar length.
+    Each cut is moved to the middle of the silence closest to the even
+    split point, so no word is cut in half. Without a silence nearby the
+    even split point is used.
+    Returns a list of (start, end) tuples in seconds.
+    """
+    midpoints = [(start + end) / 2 for start, end in silences]
+    window = duration / count / 2
+
+    cuts = []
+    for k in range(1, count):
+        ideal = duration * k / count
+        near = [m for m in midpoints if abs(m - ideal) <= window and (not cuts or m > cuts[-1])]
+        cuts.append(min(near, key=lambda m: abs(m - ideal)) if near else ideal)
+
+    bounds = [0.0] + cuts + [duration]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def cut_wav(path, start, end, output_path):
+    """
+    Copies the [start, end] range of a WAV file into output_path.
+    """
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-ss", f"{start:.3f}",
+        "-t", f"{end - start:.3f}",
+        "-i", path,
+        "-c", "copy",
+        output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def speech_spans(duration, silences, padding):
+    """
+    Returns the (start, end) spans of [0, duration] outside the silences,
+    each silence shortened by padding seconds on both sides so the speech
+    around it isn't clipped.
+    """
+    spans = []
+    position = 0.0
+    for start, end in silences:
+        cut_start, cut_end = start + padding, end - padding
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            spans.append((position, cut_start))
+        position = max(position, cut_end)
+    if position < duration:
+        spans.append((position, duration))
+    return spans
+
+def keep_spans(path, spans, output_path):
+    """
+    Writes only the given (start, end) spans of a WAV file, back to back,
+    into output_path.
+    """
+    with wave.open(path, 'rb') as src, wave.open(output_path, 'wb') as dst:
+        dst.setparams(src.getparams())
+        rate = src.getframerate()
+        for start, end in spans:
+            first = int(start * rate)
+            remaining = min(int(end * rate), src.getnframes()) - first
+            src.setpos(first)
+            while remaining > 0:
+                frames = min(remaining, rate * 60)
+                dst.writeframes(src.readframes(frames))
+                remaining -= frames
+
+def original_timeline(spans):
+    """
+    Returns a function mapping a time in audio cut down to spans (with
+    keep_spans) back to the time in the original audio.
+    """
+    offsets = []
+    total = 0.0
+    for start, end in spans:
+        offsets.append(total)
+        total += end - start
+
+    def to_original(seconds):
+        i = max(0, bisect.bisect_right(offsets, seconds) - 1)
+        start, end = spans[i]
+        return min(start + seconds - offsets[i], end)
+    return to_original
+
+def _normalize(word):
+    return re.sub(r"\W", "", word.lower())
+
+def stitch(texts, max_overlap=0):
+    """
+    Joins chunk transcripts in order. For chunks cut with overlapping audio,
+    words repeated on both sides of a chunk boundary (up to max_overlap of
+    them) are kept only once. Chunks cut at silences don't overlap, so by
+    default nothing is removed: a repeated word there was really said twice.
+    """
+    stitched = []
+    tail = []
+    for text in texts:
+        parts = re.split(r"(\s+)", text.strip())
+        words = parts[::2]
+        limit = min(max_overlap, len(tail), len(words))
+        for m in range(limit, 0, -1):
+            if [_normalize(w) for w in tail[-m:]] == [_normalize(w) for w in words[:m]]:
+                parts = parts[2 * m:]
+                break
+
+        text = "".join(parts).strip()
+        if text:
+            stitched.append(text)
+            if max_overlap:
+                tail = (tail + text.split())[-max_overlap:]
+    return "\n".join(stitched) + "\n"
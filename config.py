@@ -58,6 +58,8 @@ def get_config(key_path, default=None):
 GPODDER_USERNAME = os.getenv("GPODDER_USERNAME")
 GPODDER_PASSWORD = os.getenv("GPODDER_PASSWORD")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Shared secret between the queue service and the worker nodes
+QUEUE_TOKEN = os.getenv("QUEUE_TOKEN")
 
 AUTH = (GPODDER_USERNAME, GPODDER_PASSWORD)
 
@@ -66,6 +68,8 @@ AUTH = (GPODDER_USERNAME, GPODDER_PASSWORD)
 # gPodder
 GPODDER_BASE_URL = get_config("gpodder.base_url", "").rstrip("/")
 SINCE_TIMESTAMP = int(get_config("gpodder.since_timestamp", 0))
+# Episodes played less than this fraction (position/total) are skipped. 0 = disabled.
+MIN_PLAY_PROGRESS = float(get_config("gpodder.min_play_progress", 0))
 
 # Paths
 DOWNLOAD_DIR = get_config("paths.downloads", "data/downloads")
@@ -74,12 +78,55 @@ SUMMARY_DIR = get_config("paths.summaries", "data/summaries")
 MODELS_DIR = get_config("paths.models", "data/models")
 STATE_FILE = get_config("paths.state_file", "data/state.json")
 PROMPT_FILE = get_config("paths.prompt_file", "prompt.md")
+STORE_DIR = get_config("paths.store", "data/store")
+CHUNK_PROMPT_FILE = get_config("paths.chunk_prompt_file", "prompt_chunk.md")
+REDUCE_PROMPT_FILE = get_config("paths.reduce_prompt_file", "prompt_reduce.md")
+CHUNK_CACHE_DIR = get_config("paths.chunk_cache", "data/cache/summary_chunks")
+FEED_CACHE_DIR = get_config("paths.feed_cache", "data/feed_cache")
+LLM_CACHE_DIR = get_config("paths.llm_cache", "data/cache/llm")
+SEARCH_DB = get_config("paths.search_db", "data/search.db")
+STORAGE_DB = get_config("paths.storage_db", "data/storage.db")
+BACKFILL_DIR = get_config("paths.backfill", "data/backfill")
+
+# HTTP client
+HTTP_POOL_CONNECTIONS = int(get_config("http.pool_connections", 10))
+HTTP_POOL_MAXSIZE = int(get_config("http.pool_maxsize", 10))
+HTTP_RETRIES = int(get_config("http.retries", 3))
+HTTP_BACKOFF_FACTOR = float(get_config("http.backoff_factor", 0.5))
+
+# Downloads
+DOWNLOAD_CHUNK_SIZE = int(get_config("download.chunk_size", 1048576))
+DOWNLOAD_SEGMENTS = int(get_config("download.segments", 1))
+DOWNLOAD_MIN_SEGMENT_SIZE = int(get_config("download.min_segment_size", 4194304))
+
+# RSS feeds
+FEED_STREAMING = bool(get_config("rss.streaming", False))
+FEED_STREAM_CHUNK_SIZE = int(get_config("rss.stream_chunk_size", 65536))
 
 # LLM Configuration
 LLM_PROVIDER = get_config("llm.provider", "gemini").lower()
 GEMINI_MODEL = get_config("llm.gemini.model", "gemini-3-flash-preview")
 OLLAMA_BASE_URL = get_config("llm.ollama.base_url", "http://localhost:11434")
 OLLAMA_MODEL = get_config("llm.ollama.model", "llama3")
+# Stream responses to disk as they are generated
+LLM_STREAM = bool(get_config("llm.stream", False))
+# Seconds to connect (Ollama), to the first piece of output, and for the whole response
+LLM_CONNECT_TIMEOUT = float(get_config("llm.timeouts.connect", 10))
+LLM_FIRST_TOKEN_TIMEOUT = float(get_config("llm.timeouts.first_token", 300))
+LLM_TOTAL_TIMEOUT = float(get_config("llm.timeouts.total", 1800))
+# Reuse summaries of the same transcript with the same provider, model and prompt
+LLM_CACHE_ENABLED = bool(get_config("llm.cache", True))
+
+# Gemini Batch API: prompts of concurrent workers are sent as one batch job
+GEMINI_BATCH_ENABLED = bool(get_config("llm.gemini.batch.enabled", False))
+GEMINI_BATCH_MAX_SIZE = int(get_config("llm.gemini.batch.max_size", 100))
+GEMINI_BATCH_MAX_WAIT = float(get_config("llm.gemini.batch.max_wait", 30))
+GEMINI_BATCH_POLL_INTERVAL = float(get_config("llm.gemini.batch.poll_interval", 30))
+
+# Map-reduce summaries for transcripts longer than chunk_tokens
+MAP_REDUCE_ENABLED = bool(get_config("llm.map_reduce.enabled", False))
+MAP_REDUCE_CHUNK_TOKENS = int(get_config("llm.map_reduce.chunk_tokens", 6000))
+MAP_REDUCE_CONCURRENCY = get_config("llm.map_reduce.concurrency", {"gemini": 4, "ollama": 1})
 
 # Whisper Configuration
 WHISPER_ROOT = get_config("whisper.root", "/app/whisper.cpp")
@@ -94,3 +141,108 @@ if _whisper_bin_conf:
 else:
     # Default to standard build path inside WHISPER_ROOT
     WHISPER_BIN = os.path.join(WHISPER_ROOT, "build/bin/whisper-cli")
+
+# Whisper backend: "cli" runs whisper-cli per episode, "server" keeps
+# whisper-server processes running so the model is loaded only once
+WHISPER_BACKEND = get_config("whisper.backend", "cli").lower()
+_whisper_server_bin_conf = get_config("whisper.server_bin_path")
+WHISPER_SERVER_BIN = _whisper_server_bin_conf or os.path.join(WHISPER_ROOT, "build/bin/whisper-server")
+WHISPER_SERVER_HOST = get_config("whisper.server_host", "127.0.0.1")
+WHISPER_SERVER_PORT = int(get_config("whisper.server_port", 8178))
+WHISPER_SERVER_STARTUP_TIMEOUT = float(get_config("whisper.server_startup_timeout", 120))
+
+# Whisper threads per process. If left empty, the cores are split evenly
+# between the transcription workers of the pipeline.
+WHISPER_THREADS = get_config("whisper.threads")
+
+# How whisper gets the 16kHz audio: "file" (WAV written to the scratch dir)
+# or "pipe" (ffmpeg streams into whisper-cli's stdin, nothing hits the disk)
+WHISPER_AUDIO_INPUT = get_config("whisper.audio_input", "file").lower()
+# Directory for temporary WAV files. If left empty, they go next to the audio.
+WHISPER_SCRATCH_DIR = get_config("whisper.scratch_dir")
+
+# Also keep whisper's segment timestamps, in <transcript>.seg (see segments.py)
+WHISPER_SEGMENTS = bool(get_config("whisper.segments", False))
+
+# Chunked transcription of long episodes: the audio is split at silences and
+# the chunks run in parallel whisper processes. 1 = disabled.
+WHISPER_CHUNKS = int(get_config("whisper.chunks", 1))
+WHISPER_CHUNK_MIN_DURATION = float(get_config("whisper.chunk_min_duration", 900))
+WHISPER_SILENCE_DB = float(get_config("whisper.silence_db", -35))
+WHISPER_SILENCE_MIN_DURATION = float(get_config("whisper.silence_min_duration", 0.5))
+# Leave silences out of the audio sent to whisper (file mode only)
+WHISPER_TRIM_SILENCE = bool(get_config("whisper.trim_silence.enabled", False))
+WHISPER_TRIM_SILENCE_DB = float(get_config("whisper.trim_silence.noise_db", -45))
+WHISPER_TRIM_MIN_SILENCE = float(get_config("whisper.trim_silence.min_duration", 2.0))
+WHISPER_TRIM_PADDING = float(get_config("whisper.trim_silence.padding", 0.25))
+
+# Polling: the interval drops to min_interval after new plays and grows by
+# backoff_factor on every idle poll, up to max_interval
+POLL_MIN_INTERVAL = float(get_config("polling.min_interval", 60))
+POLL_MAX_INTERVAL = float(get_config("polling.max_interval", 600))
+POLL_BACKOFF_FACTOR = float(get_config("polling.backoff_factor", 2))
+POLL_TRIGGER_HOST = get_config("polling.trigger_host", "127.0.0.1")
+_poll_trigger_port = get_config("polling.trigger_port")
+POLL_TRIGGER_PORT = int(_poll_trigger_port) if _poll_trigger_port else None
+
+# Roles of this node: "all" (single node), "poller", "queue", "downloader",
+# "transcriber", "summarizer". Overridden by the --role command line option.
+NODE_ROLES = get_config("node.roles", ["all"])
+
+# Job queue
+QUEUE_DB = get_config("paths.queue_db", "data/queue.db")
+# URL of a shared queue service (a node with the "queue" role).
+# If left empty, the local SQLite database is used.
+QUEUE_URL = get_config("queue.url")
+QUEUE_LISTEN_HOST = get_config("queue.listen_host", "127.0.0.1")
+QUEUE_LISTEN_PORT = int(get_config("queue.listen_port", 8765))
+QUEUE_LEASE_SECONDS = float(get_config("queue.lease_seconds", 300))
+QUEUE_MAX_ATTEMPTS = int(get_config("queue.max_attempts", 5))
+QUEUE_RETRY_BACKOFF = float(get_config("queue.retry_backoff", 60))
+QUEUE_RETRY_BACKOFF_MAX = float(get_config("queue.retry_backoff_max", 21600))
+# Order of the queue: "fifo", "recent" (latest play first) or "shortest"
+# (shortest episode first). Podcasts in podcast_priority go first.
+QUEUE_POLICY = get_config("queue.policy", "fifo").lower()
+QUEUE_PODCAST_PRIORITY = get_config("queue.podcast_priority", {})
+
+# Pipeline
+# "threads": staged worker pools, "async": asyncio/httpx for the network stages
+PIPELINE_ENGINE = get_config("pipeline.engine", "threads").lower()
+ASYNC_PER_HOST_LIMIT = int(get_config("pipeline.per_host_limit", 4))
+PIPELINE_DOWNLOAD_WORKERS = int(get_config("pipeline.download_workers", 2))
+PIPELINE_TRANSCRIBE_WORKERS = int(get_config("pipeline.transcribe_workers", 1))
+PIPELINE_SUMMARIZE_WORKERS = int(get_config("pipeline.summarize_workers", 2))
+# In Gemini batch mode every summary waiting for its batch holds a worker,
+# so there must be enough of them to fill a batch
+if LLM_PROVIDER == "gemini" and GEMINI_BATCH_ENABLED:
+    PIPELINE_SUMMARIZE_WORKERS = max(PIPELINE_SUMMARIZE_WORKERS, GEMINI_BATCH_MAX_SIZE)
+PIPELINE_QUEUE_SIZE = int(get_config("pipeline.queue_size", 2))
+
+def parse_size(value):
+    """
+    Parses a size like 500M or 20G (powers of 1024), or a number of bytes.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+# Storage: byte budget per artifact class (audio, transcripts, summaries,
+# llm_cache, chunk_cache) and space to keep free on the disk
+STORAGE_BUDGETS = {name: parse_size(size) for name, size in (get_config("storage.budgets", {}) or {}).items()}
+STORAGE_MIN_FREE = parse_size(get_config("storage.min_free", "1G"))
+# Evict the least recently used ("lru") or the oldest ("age") files first
+STORAGE_EVICTION = get_config("storage.eviction", "lru").lower()
+
+# Full-text search index, updated as transcripts and summaries are written
+SEARCH_ENABLED = bool(get_config("search.enabled", True))
+
+# Metrics: Prometheus /metrics endpoint (disabled unless a port is set)
+# and an optional JSON-lines event log
+METRICS_HOST = get_config("metrics.host", "127.0.0.1")
+_metrics_port = get_config("metrics.port")
+METRICS_PORT = int(_metrics_port) if _metrics_port else None
+METRICS_LOG_FILE = get_config("metrics.log_file")
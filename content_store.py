@@ -0,0 +1,169 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from config import STORE_DIR
+
+AUDIO_DIR = os.path.join(STORE_DIR, "audio")
+TRANSCRIPTS_DIR = os.path.join(STORE_DIR, "transcripts")
+SUMMARIES_DIR = os.path.join(STORE_DIR, "summaries")
+URLS_DIR = os.path.join(STORE_DIR, "urls")
+INCOMING_DIR = os.path.join(STORE_DIR, "incoming")
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def key_lock(key):
+    """
+    Returns a lock for the given URL or content hash, so two workers never
+    process the same artifact at the same time.
+    """
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+def url_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+def file_hash(path):
+    """
+    Returns the SHA-256 of a file's content.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1048576), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def incoming_path(url, ext):
+    """
+    Path where the audio of url is downloaded before it is hashed.
+    """
+    return os.path.join(INCOMING_DIR, url_key(url) + ext)
+
+def transcript_path(content):
+    return os.path.join(TRANSCRIPTS_DIR, content + ".txt")
+
+def summary_path(content):
+    return os.path.join(SUMMARIES_DIR, content + ".md")
+
+def find_audio(url):
+    """
+    Returns the stored audio for url if it was downloaded before, else None.
+    """
+    record = os.path.join(URLS_DIR, url_key(url) + ".json")
+    if not os.path.exists(record):
+        return None
+    try:
+        with open(record, 'r') as f:
+            audio = os.path.join(AUDIO_DIR, json.load(f)["audio"])
+    except (json.JSONDecodeError, IOError, KeyError):
+        return None
+    return audio if os.path.exists(audio) else None
+
+def add_audio(path, url):
+    """
+    Moves a downloaded file into the store under the hash of its bytes and
+    records url as one of its sources.
+    Returns the stored path. Identical audio from another URL is kept once.
+    """
+    content = file_hash(path)
+    ext = os.path.splitext(path)[1]
+    stored = os.path.join(AUDIO_DIR, content + ext)
+
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    if os.path.exists(stored):
+        print(f"Identical audio already stored: {stored}")
+        os.remove(path)
+    else:
+        # A move, as adopted files may live on another file system
+        shutil.move(path, stored)
+
+    os.makedirs(URLS_DIR, exist_ok=True)
+    record = os.path.join(URLS_DIR, url_key(url) + ".json")
+    tmp_record = record + ".tmp"
+    with open(tmp_record, 'w') as f:
+        json.dump({"url": url, "audio": os.path.basename(stored)}, f)
+    os.replace(tmp_record, record)
+    return stored
+
+def content_hash(path):
+    """
+    Returns the content hash behind a stored artifact or one of its views,
+    or None for files that are not in the store.
+    """
+    real = os.path.realpath(path)
+    for directory in (AUDIO_DIR, TRANSCRIPTS_DIR, SUMMARIES_DIR):
+        if os.path.dirname(real) == os.path.realpath(directory):
+            return os.path.basename(real).split(".", 1)[0]
+    return None
+
+def is_legacy_file(path):
+    """
+    Whether path is a plain file written before the content store existed,
+    rather than a view of a stored artifact.
+    """
+    return (os.path.isfile(path) and not os.path.islink(path)
+            and os.stat(path).st_nlink == 1 and content_hash(path) is None)
+
+def adopt(path, stored):
+    """
+    Moves a legacy file into the store as stored, along with its segment
+    and provenance files, and links it back at path.
+    Returns the stored path, or None if stored exists already (the legacy
+    file is then left as it is).
+    """
+    if os.path.exists(stored):
+        return None
+    os.makedirs(os.path.dirname(stored), exist_ok=True)
+    shutil.move(path, stored)
+    for old, new in ((os.path.splitext(path)[0] + ".seg", os.path.splitext(stored)[0] + ".seg"),
+                     (path + ".meta", stored + ".meta")):
+        if os.path.exists(old) and not os.path.exists(new):
+            shutil.move(old, new)
+    link_view(stored, path)
+    print(f"Moved {path} into the store")
+    return stored
+
+def _links_to(view_path, target):
+    """
+    Whether view_path is a symlink (or hard link) to target.
+    """
+    if os.path.realpath(view_path) == os.path.realpath(target):
+        return True
+    try:
+        return os.path.samefile(view_path, target)
+    except OSError:
+        return False
+
+def link_view(target, view_path):
+    """
+    Makes view_path a human-readable symlink to the stored target.
+    If view_path is already taken by another file (e.g. two episodes that
+    both fell back to "Unknown Episode"), a short hash is added to the name.
+    Returns the view path that was used.
+    """
+    if os.path.lexists(view_path):
+        if _links_to(view_path, target):
+            return view_path
+        base, ext = os.path.splitext(view_path)
+        digest = content_hash(target)
+        # Longer hashes for the rare clash of the short one
+        for length in (8, 16, len(digest)):
+            view_path = f"{base} [{digest[:length]}]{ext}"
+            if not os.path.lexists(view_path):
+                break
+            if _links_to(view_path, target):
+                return view_path
+        else:
+            # The full hash names this content, so whatever is there is stale
+            os.remove(view_path)
+
+    os.makedirs(os.path.dirname(view_path), exist_ok=True)
+    relative_target = os.path.relpath(os.path.realpath(target), os.path.dirname(os.path.abspath(view_path)))
+    try:
+        os.symlink(relative_target, view_path)
+    except OSError:
+        # Filesystems without symlinks get a hard link instead
+        os.link(target, view_path)
+    return view_path
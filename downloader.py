@@ -1,6 +1,196 @@
 import os
-import requests
-from config import DOWNLOAD_DIR
+import json
+import asyncio
+import threading
+import metrics
+import storage
+import content_store
+from http_client import get_session
+from concurrent.futures import ThreadPoolExecutor
+from config import DOWNLOAD_DIR, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_SEGMENTS, DOWNLOAD_MIN_SEGMENT_SIZE
+
+# Fake user agent to avoid some 403s from strict servers
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def _meta_path(part_path):
+    return part_path + ".json"
+
+def _load_meta(part_path):
+    """
+    Loads the sidecar of a partial download, or None if there is none.
+    """
+    path = _meta_path(part_path)
+    if not os.path.exists(part_path) or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+
+def _save_meta(part_path, meta):
+    tmp_path = _meta_path(part_path) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, _meta_path(part_path))
+
+def _validators(r):
+    return {
+        "etag": r.headers.get('ETag'),
+        "last_modified": r.headers.get('Last-Modified')
+    }
+
+def _if_range(meta):
+    # Servers answer with the full file instead of a range if it changed
+    return meta.get("etag") or meta.get("last_modified")
+
+def _download_single(url, part_path):
+    """
+    Streams url into part_path over one connection, resuming from the
+    end of an existing partial file with a Range request.
+    """
+    meta = _load_meta(part_path)
+    offset = os.path.getsize(part_path) if meta and "segments" not in meta else 0
+
+    headers = dict(HEADERS)
+    if offset and _if_range(meta):
+        headers['Range'] = f"bytes={offset}-"
+        headers['If-Range'] = _if_range(meta)
+    else:
+        offset = 0
+
+    with get_session().get(url, stream=True, timeout=60, headers=headers) as r:
+        if r.status_code == 416 and offset:
+            if meta.get("size") == offset:
+                # Already complete, only the rename was missing
+                return
+            # Partial file doesn't match the remote one, start over next time
+            os.remove(part_path)
+        r.raise_for_status()
+
+        if offset and r.status_code == 206:
+            print(f"Resuming download at {offset} bytes...")
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            size = r.headers.get('Content-Length')
+            meta = dict(_validators(r), url=url, size=int(size) if size else None)
+            _save_meta(part_path, meta)
+        # Content-Length is what is left to download, also when resuming
+        storage.ensure_space(int(r.headers.get('Content-Length') or 0))
+
+        with open(part_path, mode) as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                metrics.inc("podgist_download_bytes_total", len(chunk))
+
+    if meta.get("size") and os.path.getsize(part_path) != meta["size"]:
+        raise IOError(f"Incomplete download: {os.path.getsize(part_path)} of {meta['size']} bytes")
+
+def _probe(url):
+    """
+    Asks for the first byte of url to learn its size and whether the
+    server honours range requests.
+    Returns the remote metadata, or None if ranges are not supported.
+    """
+    headers = dict(HEADERS, Range="bytes=0-0")
+    with get_session().get(url, stream=True, timeout=60, headers=headers) as r:
+        r.raise_for_status()
+        if r.status_code != 206 or r.headers.get('Accept-Ranges', 'bytes') == 'none':
+            return None
+        # Content-Range: bytes 0-0/12345
+        total = r.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+        if not total.isdigit():
+            return None
+        return dict(_validators(r), url=url, size=int(total))
+
+def _split(size, count):
+    """
+    Splits [0, size) into count [start, end, done] segments (end inclusive).
+    """
+    step = -(-size // count)
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+def _preallocate(part_path, size):
+    with open(part_path, 'wb') as f:
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                pass
+        f.truncate(size)
+
+def _fetch_segment(url, part_path, meta, index, lock):
+    """
+    Downloads the missing part of one segment and writes it at its offset.
+    Progress is recorded in the sidecar after every chunk.
+    """
+    start, end, done = meta["segments"][index]
+    headers = dict(HEADERS, Range=f"bytes={start + done}-{end}")
+    if _if_range(meta):
+        headers['If-Range'] = _if_range(meta)
+
+    with get_session().get(url, stream=True, timeout=60, headers=headers) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise IOError("Server ignored the range request (file changed?)")
+
+        with open(part_path, 'r+b') as f:
+            f.seek(start + done)
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                chunk = chunk[:end + 1 - (start + done)]
+                if not chunk:
+                    break
+                f.write(chunk)
+                f.flush()
+                done += len(chunk)
+                metrics.inc("podgist_download_bytes_total", len(chunk))
+                with lock:
+                    meta["segments"][index][2] = done
+                    _save_meta(part_path, meta)
+
+    if start + done <= end:
+        raise IOError(f"Segment {index} incomplete: {done} of {end + 1 - start} bytes")
+
+def _download_segmented(url, part_path):
+    """
+    Downloads url over DOWNLOAD_SEGMENTS parallel range requests into a
+    preallocated part file, resuming any unfinished segments.
+    Returns False if the server does not support ranges.
+    """
+    remote = _probe(url)
+    if not remote or remote["size"] < DOWNLOAD_MIN_SEGMENT_SIZE * 2:
+        return False
+
+    meta = _load_meta(part_path)
+    same_file = (
+        meta and meta.get("segments")
+        and meta.get("size") == remote["size"]
+        and meta.get("etag") == remote["etag"]
+        and meta.get("last_modified") == remote["last_modified"]
+    )
+    if same_file:
+        print(f"Resuming segmented download of {url}...")
+    else:
+        count = min(DOWNLOAD_SEGMENTS, remote["size"] // DOWNLOAD_MIN_SEGMENT_SIZE)
+        meta = dict(remote, segments=_split(remote["size"], count))
+        storage.ensure_space(remote["size"])
+        _preallocate(part_path, remote["size"])
+        _save_meta(part_path, meta)
+
+    pending = [i for i, (start, end, done) in enumerate(meta["segments"]) if start + done <= end]
+    if not pending:
+        return True
+
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+        futures = [pool.submit(_fetch_segment, url, part_path, meta, i, lock) for i in pending]
+        for future in futures:
+            future.result()
+    return True
 
 def download_file(url, filename=None, relative_path=None):
     if not os.path.exists(DOWNLOAD_DIR):
@@ -15,14 +205,14 @@ def download_file(url, filename=None, relative_path=None):
             # Basic cleanup of query parameters if present
             if "?" in filename:
                 filename = filename.split("?")[0]
-        
+
         # Ensure filename is safe (basic)
         filename = "".join([c for c in filename if c.isalpha() or c.isdigit() or c in (' ', '.', '_', '-')]).strip()
         if not filename:
             filename = "unknown_episode.mp3"
 
         filepath = os.path.join(DOWNLOAD_DIR, filename)
-    
+
     # Ensure directory exists
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
@@ -30,22 +220,147 @@ def download_file(url, filename=None, relative_path=None):
         print(f"File already exists: {filepath}")
         return filepath
 
+    return fetch_to(url, filepath)
+
+def fetch_to(url, filepath):
+    """
+    Downloads url to filepath.
+    Returns filepath, or None if the download failed.
+    """
+    # Data goes to a .part file that is only renamed once complete.
+    # It is kept on errors so the next attempt can resume.
+    part_path = filepath + ".part"
+
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
     print(f"Downloading {url} to {filepath}...")
     try:
-        # Fake user agent to avoid some 403s from strict servers
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        with requests.get(url, stream=True, timeout=60, headers=headers) as r:
-            r.raise_for_status()
-            with open(filepath, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        if DOWNLOAD_SEGMENTS <= 1 or not _download_segmented(url, part_path):
+            _download_single(url, part_path)
+        os.replace(part_path, filepath)
+        if os.path.exists(_meta_path(part_path)):
+            os.remove(_meta_path(part_path))
         print(f"Download complete: {filepath}")
         return filepath
     except Exception as e:
         print(f"Error downloading {url}: {e}")
-        # Clean up partial file
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if os.path.exists(part_path):
+            print(f"Partial download kept for resume: {part_path}")
         return None
+
+def download_episode(url, relative_path):
+    """
+    Downloads an episode into the content-addressed store and links it at
+    relative_path inside DOWNLOAD_DIR.
+    URLs downloaded before are not fetched again, and identical audio from
+    several URLs is stored once.
+    Returns the path of the view, or None if the download failed.
+    """
+    view_path = os.path.join(DOWNLOAD_DIR, relative_path)
+
+    with content_store.key_lock(url):
+        stored = content_store.find_audio(url)
+        metrics.cache_result("audio", stored is not None)
+        if stored:
+            print(f"File already exists: {stored}")
+            storage.touch(stored)
+        elif content_store.is_legacy_file(view_path):
+            # Downloaded before the content store existed
+            stored = content_store.add_audio(view_path, url)
+            storage.add(stored)
+        else:
+            ext = os.path.splitext(relative_path)[1]
+            incoming = content_store.incoming_path(url, ext)
+            if not os.path.exists(incoming) and not fetch_to(url, incoming):
+                return None
+            stored = content_store.add_audio(incoming, url)
+            storage.add(stored)
+
+    return content_store.link_view(stored, view_path)
+
+async def fetch_to_async(client, url, filepath):
+    """
+    Async counterpart of fetch_to for an httpx.AsyncClient, over a single
+    connection. Uses the same .part file and sidecar, so downloads can be
+    resumed by either engine.
+    Returns filepath, or None if the download failed.
+    """
+    part_path = filepath + ".part"
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    print(f"Downloading {url} to {filepath}...")
+    try:
+        meta = _load_meta(part_path)
+        offset = os.path.getsize(part_path) if meta and "segments" not in meta else 0
+
+        headers = dict(HEADERS)
+        if offset and _if_range(meta):
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = _if_range(meta)
+        else:
+            offset = 0
+
+        async with client.stream("GET", url, headers=headers, timeout=60) as r:
+            if r.status_code == 416 and offset:
+                if meta.get("size") != offset:
+                    # Partial file doesn't match the remote one, start over next time
+                    os.remove(part_path)
+                    r.raise_for_status()
+                # Otherwise already complete, only the rename was missing
+            else:
+                r.raise_for_status()
+                if offset and r.status_code == 206:
+                    print(f"Resuming download at {offset} bytes...")
+                    mode = 'ab'
+                else:
+                    mode = 'wb'
+                    size = r.headers.get('Content-Length')
+                    meta = dict(_validators(r), url=url, size=int(size) if size else None)
+                    _save_meta(part_path, meta)
+                await asyncio.to_thread(storage.ensure_space, int(r.headers.get('Content-Length') or 0))
+
+                # File writes run in a thread, so a slow disk doesn't stall the event loop
+                f = await asyncio.to_thread(open, part_path, mode)
+                try:
+                    async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                        metrics.inc("podgist_download_bytes_total", len(chunk))
+                finally:
+                    await asyncio.to_thread(f.close)
+
+        if meta.get("size") and os.path.getsize(part_path) != meta["size"]:
+            raise IOError(f"Incomplete download: {os.path.getsize(part_path)} of {meta['size']} bytes")
+
+        os.replace(part_path, filepath)
+        if os.path.exists(_meta_path(part_path)):
+            os.remove(_meta_path(part_path))
+        print(f"Download complete: {filepath}")
+        return filepath
+    except Exception as e:
+        print(f"Error downloading {url}: {e}")
+        if os.path.exists(part_path):
+            print(f"Partial download kept for resume: {part_path}")
+        return None
+
+async def download_episode_async(client, url, relative_path):
+    """
+    Async counterpart of download_episode.
+    Hashing the finished file runs in a thread to keep the event loop free.
+    """
+    view_path = os.path.join(DOWNLOAD_DIR, relative_path)
+
+    stored = content_store.find_audio(url)
+    metrics.cache_result("audio", stored is not None)
+    if stored:
+        print(f"File already exists: {stored}")
+        storage.touch(stored)
+    elif content_store.is_legacy_file(view_path):
+        stored = await asyncio.to_thread(content_store.add_audio, view_path, url)
+        await asyncio.to_thread(storage.add, stored)
+    else:
+        ext = os.path.splitext(relative_path)[1]
+        incoming = content_store.incoming_path(url, ext)
+        if not os.path.exists(incoming) and not await fetch_to_async(client, url, incoming):
+            return None
+        stored = await asyncio.to_thread(content_store.add_audio, incoming, url)
+        await asyncio.to_thread(storage.add, stored)
+
+    return content_store.link_view(stored, view_path)
@@ -0,0 +1,354 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import metrics
+from http_client import get_session
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from config import FEED_CACHE_DIR, FEED_STREAMING, FEED_STREAM_CHUNK_SIZE
+
+# Some feeds might require a User-Agent
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (PodGist/1.0)'
+}
+
+_memory = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+# Query parameters that only track the listener, never identify the episode
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "source", "from", "aid"}
+
+def normalize_url(url):
+    """
+    Normalizes an enclosure URL for lookups: drops the scheme, fragment and
+    tracking parameters (utm_* and TRACKING_PARAMS), sorts the rest of the
+    query, and lowercases the host.
+    The rest of the query is kept, as some hosts tell episodes apart by it
+    (e.g. media.php?id=1 and media.php?id=2).
+    """
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    )
+    normalized = parts.netloc.lower() + parts.path
+    return normalized + "?" + urlencode(query) if query else normalized
+
+def parse_feed(content):
+    """
+    Parses RSS content into a feed dict:
+    {"title": podcast title, "episodes": {key: episode title},
+     "lengths": {normalized enclosure URL: size in bytes}}
+    where episode keys are enclosure URLs, normalized enclosure URLs and guids.
+    """
+    root = ET.fromstring(content)
+
+    # Handle cases where root is rss/channel or just channel
+    channel = root.find('channel')
+    if channel is None and root.tag == 'channel':
+        channel = root
+
+    podcast_title = "Unknown Podcast"
+    episodes = {}
+    lengths = {}
+    if channel is None:
+        return {"title": podcast_title, "episodes": episodes, "lengths": lengths}
+
+    t = channel.findtext('title')
+    if t:
+        podcast_title = t
+
+    for item in channel.findall('item'):
+        add_item(episodes, item, lengths)
+
+    return {"title": podcast_title, "episodes": episodes, "lengths": lengths}
+
+def add_item(episodes, item, lengths=None):
+    """
+    Adds the index keys of an RSS <item> element to episodes, and its
+    enclosure length to lengths.
+    The first item wins, as a linear scan over the feed would.
+    """
+    title = item.findtext('title')
+    enclosure = item.find('enclosure')
+    if enclosure is not None:
+        url = enclosure.get('url')
+        if url:
+            episodes.setdefault(url, title)
+            episodes.setdefault(normalize_url(url), title)
+            length = enclosure.get('length', '')
+            if lengths is not None and length.isdigit() and int(length) > 0:
+                lengths.setdefault(normalize_url(url), int(length))
+    guid = item.findtext('guid')
+    if guid:
+        episodes.setdefault(guid, title)
+
+def find_episode_title(feed, episode_url):
+    """
+    Looks up the title of episode_url in a parsed feed.
+    Returns None if the episode is not in the feed.
+    """
+    episodes = feed.get("episodes", {})
+    for key in (episode_url, normalize_url(episode_url)):
+        if key in episodes:
+            return episodes[key]
+
+    # Often episode_url has extra params or a redirect prefix
+    for key, title in episodes.items():
+        if "://" in key and (episode_url in key or key in episode_url):
+            return title
+    return None
+
+def cached_enclosure_length(podcast_url, episode_url):
+    """
+    Returns the enclosure length in bytes of episode_url from the cached
+    copy of its feed, without any network request.
+    None if the feed isn't cached or doesn't give a length.
+    """
+    entry = _load(podcast_url) if podcast_url else None
+    if not entry:
+        return None
+    return entry["feed"].get("lengths", {}).get(normalize_url(episode_url))
+
+def _cache_path(podcast_url):
+    digest = hashlib.sha1(podcast_url.encode("utf-8")).hexdigest()
+    return os.path.join(FEED_CACHE_DIR, digest + ".json")
+
+def _load(podcast_url):
+    if podcast_url in _memory:
+        return _memory[podcast_url]
+    path = _cache_path(podcast_url)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding="utf-8") as f:
+            entry = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+    _memory[podcast_url] = entry
+    return entry
+
+def _save(podcast_url, entry):
+    _memory[podcast_url] = entry
+    path = _cache_path(podcast_url)
+    try:
+        os.makedirs(FEED_CACHE_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except IOError as e:
+        print(f"Warning: Could not write feed cache for {podcast_url}: {e}")
+
+def _lock_for(podcast_url):
+    with _locks_guard:
+        return _locks.setdefault(podcast_url, threading.Lock())
+
+def _conditional_headers(entry):
+    headers = dict(HEADERS)
+    if entry:
+        if entry.get("etag"):
+            headers['If-None-Match'] = entry["etag"]
+        if entry.get("last_modified"):
+            headers['If-Modified-Since'] = entry["last_modified"]
+    return headers
+
+def _entry_from(resp, feed, complete=True):
+    return {
+        "etag": resp.headers.get('ETag'),
+        "last_modified": resp.headers.get('Last-Modified'),
+        "complete": complete,
+        "feed": feed
+    }
+
+def get_feed(podcast_url):
+    """
+    Returns the parsed feed for podcast_url.
+
+    The feed is cached on disk with its ETag/Last-Modified validators and
+    revalidated with a conditional GET, so an unchanged feed costs a single
+    304 round trip and no parsing.
+    """
+    with _lock_for(podcast_url):
+        entry = _load(podcast_url)
+        if entry and not entry.get("complete", True):
+            # A partial index from a streamed parse can't answer everything
+            entry = None
+
+        resp = get_session().get(podcast_url, headers=_conditional_headers(entry), timeout=30)
+        metrics.cache_result("feed", resp.status_code == 304 and entry is not None)
+        if resp.status_code == 304 and entry:
+            return entry["feed"]
+        resp.raise_for_status()
+
+        feed = parse_feed(resp.content)
+        _save(podcast_url, _entry_from(resp, feed))
+        return feed
+
+class _FeedIndexer:
+    """
+    Indexes an RSS document fed to it in chunks, one <item> at a time, and
+    notes the first item matching each of the wanted episode URLs.
+    Each <item> is dropped once indexed, so memory stays flat however
+    large the feed is.
+    """
+
+    def __init__(self, episode_urls):
+        self.parser = ET.XMLPullParser(events=("start", "end"))
+        self.wanted = list(episode_urls)
+        self.found = {}
+        self.podcast_title = "Unknown Podcast"
+        self.episodes = {}
+        self.lengths = {}
+        self.stack = []
+        self.channel = None
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk. Returns True once every wanted episode is found.
+        """
+        self.parser.feed(chunk)
+        for event, elem in self.parser.read_events():
+            if event == "start":
+                self.stack.append(elem.tag)
+                if elem.tag == 'channel':
+                    self.channel = elem
+                continue
+
+            self.stack.pop()
+            if elem.tag == 'title' and self.stack and self.stack[-1] == 'channel':
+                self.podcast_title = elem.text or self.podcast_title
+            elif elem.tag == 'item' and self.stack and self.stack[-1] == 'channel':
+                item_episodes = {}
+                add_item(item_episodes, elem, self.lengths)
+                for key, title in item_episodes.items():
+                    self.episodes.setdefault(key, title)
+                elem.clear()
+                self.channel.remove(elem)
+
+                for url in self.wanted:
+                    if url not in self.found:
+                        title = find_episode_title({"episodes": item_episodes}, url)
+                        if title is not None:
+                            self.found[url] = title
+        return bool(self.wanted) and len(self.found) == len(self.wanted)
+
+    def close(self):
+        self.parser.close()
+
+    def result(self):
+        return {"title": self.podcast_title, "episodes": self.episodes, "lengths": self.lengths}
+
+def stream_feed(resp, episode_url, stop_early=True):
+    """
+    Incrementally parses an RSS response and, with stop_early, stops reading
+    as soon as an item matching episode_url is found.
+    Returns (feed, episode_title, complete).
+    """
+    indexer = _FeedIndexer([episode_url])
+    for chunk in resp.iter_content(chunk_size=FEED_STREAM_CHUNK_SIZE):
+        if indexer.feed(chunk) and stop_early:
+            return indexer.result(), indexer.found[episode_url], False
+    indexer.close()
+    return indexer.result(), indexer.found.get(episode_url), True
+
+async def stream_feed_async(resp, episode_urls, stop_early=True):
+    """
+    Async counterpart of stream_feed for an httpx response, stopping once
+    items for all episode_urls are found.
+    Returns (feed, complete).
+    """
+    indexer = _FeedIndexer(episode_urls)
+    async for chunk in resp.aiter_bytes(FEED_STREAM_CHUNK_SIZE):
+        if indexer.feed(chunk) and stop_early:
+            return indexer.result(), False
+    indexer.close()
+    return indexer.result(), True
+
+def lookup_episode(podcast_url, episode_url):
+    """
+    Returns (podcast_title, episode_title) for episode_url, with
+    episode_title None if the feed doesn't list it.
+
+    With rss.streaming enabled, feeds that are not in the cache yet are
+    parsed incrementally and the download stops at the matching item. The
+    partial index is cached as well; it is only replaced by a full read of
+    the feed when a later lookup misses it.
+    """
+    if not FEED_STREAMING:
+        feed = get_feed(podcast_url)
+        return feed["title"], find_episode_title(feed, episode_url)
+
+    with _lock_for(podcast_url):
+        entry = _load(podcast_url)
+        resp = get_session().get(podcast_url, headers=_conditional_headers(entry), timeout=30, stream=True)
+        metrics.cache_result("feed", resp.status_code == 304 and entry is not None)
+        with resp:
+            if resp.status_code == 304 and entry:
+                feed = entry["feed"]
+                title = find_episode_title(feed, episode_url)
+                if title is not None or entry.get("complete", True):
+                    return feed["title"], title
+            else:
+                resp.raise_for_status()
+                feed, title, complete = stream_feed(resp, episode_url)
+                _save(podcast_url, _entry_from(resp, feed, complete))
+                return feed["title"], title
+
+        # Partial index missed: read the whole feed again, unconditionally,
+        # so the cached index is complete from now on
+        with get_session().get(podcast_url, headers=HEADERS, timeout=30, stream=True) as resp:
+            resp.raise_for_status()
+            feed, title, complete = stream_feed(resp, episode_url, stop_early=False)
+            _save(podcast_url, _entry_from(resp, feed, complete))
+            return feed["title"], title
+
+async def get_feed_async(client, podcast_url, episode_urls=()):
+    """
+    Async counterpart of get_feed for an httpx.AsyncClient, sharing the same
+    on-disk cache. Parsing runs in a thread to keep the event loop free.
+
+    With rss.streaming enabled and episode_urls given, the feed is instead
+    parsed incrementally as in lookup_episode, and the download stops once
+    all of episode_urls are found.
+    """
+    entry = _load(podcast_url)
+    if FEED_STREAMING and episode_urls:
+        return await _stream_feed_async(client, podcast_url, entry, episode_urls)
+    if entry and not entry.get("complete", True):
+        entry = None
+
+    resp = await client.get(podcast_url, headers=_conditional_headers(entry), timeout=30)
+    metrics.cache_result("feed", resp.status_code == 304 and entry is not None)
+    if resp.status_code == 304 and entry:
+        return entry["feed"]
+    resp.raise_for_status()
+
+    feed = await asyncio.to_thread(parse_feed, resp.content)
+    _save(podcast_url, _entry_from(resp, feed))
+    return feed
+
+async def _stream_feed_async(client, podcast_url, entry, episode_urls):
+    async with client.stream("GET", podcast_url, headers=_conditional_headers(entry), timeout=30) as resp:
+        metrics.cache_result("feed", resp.status_code == 304 and entry is not None)
+        if resp.status_code == 304 and entry:
+            feed = entry["feed"]
+            if entry.get("complete", True) or all(find_episode_title(feed, url) is not None for url in episode_urls):
+                return feed
+        else:
+            resp.raise_for_status()
+            feed, complete = await stream_feed_async(resp, episode_urls)
+            _save(podcast_url, _entry_from(resp, feed, complete))
+            return feed
+
+    # Partial index missed: read the whole feed again, unconditionally
+    async with client.stream("GET", podcast_url, headers=HEADERS, timeout=30) as resp:
+        resp.raise_for_status()
+        feed, complete = await stream_feed_async(resp, episode_urls, stop_early=False)
+        _save(podcast_url, _entry_from(resp, feed, complete))
+        return feed
@@ -0,0 +1,84 @@
+import time
+import threading
+from concurrent.futures import Future
+from config import GEMINI_MODEL, GEMINI_BATCH_MAX_SIZE, GEMINI_BATCH_MAX_WAIT, GEMINI_BATCH_POLL_INTERVAL
+
+FINISHED_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED"
+}
+
+class GeminiBatcher:
+    """
+    Collects prompts from concurrent summary workers and sends them to the
+    Gemini Batch API as one job, instead of one request per prompt.
+
+    A batch goes out when GEMINI_BATCH_MAX_SIZE prompts are waiting or
+    GEMINI_BATCH_MAX_WAIT seconds after the last one went out. Each batch is
+    polled in its own thread, so new prompts are collected meanwhile.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.pending = []
+        self.lock = threading.Lock()
+        self.full = threading.Event()
+        self.thread = None
+
+    def submit(self, prompt):
+        """
+        Queues a prompt. Returns a Future resolving to the text, or None.
+        """
+        future = Future()
+        with self.lock:
+            self.pending.append((prompt, future))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._collect, name="gemini-batch", daemon=True)
+                self.thread.start()
+            if len(self.pending) >= GEMINI_BATCH_MAX_SIZE:
+                self.full.set()
+        return future
+
+    def _collect(self):
+        while True:
+            self.full.wait(GEMINI_BATCH_MAX_WAIT)
+            self.full.clear()
+            with self.lock:
+                batch = self.pending[:GEMINI_BATCH_MAX_SIZE]
+                self.pending = self.pending[GEMINI_BATCH_MAX_SIZE:]
+                if self.pending:
+                    self.full.set()
+            if batch:
+                threading.Thread(target=self._send, args=(batch,), daemon=True).start()
+
+    def _send(self, batch):
+        try:
+            job = self.client.batches.create(
+                model=GEMINI_MODEL,
+                src=[{"contents": [{"role": "user", "parts": [{"text": prompt}]}]} for prompt, _ in batch],
+                config={"display_name": f"podgist-{int(time.time())}"}
+            )
+            print(f"📦 Submitted Gemini batch {job.name} with {len(batch)} prompts")
+            while job.state.name not in FINISHED_STATES:
+                time.sleep(GEMINI_BATCH_POLL_INTERVAL)
+                job = self.client.batches.get(name=job.name)
+
+            if job.state.name not in ("JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"):
+                raise RuntimeError(f"batch {job.name} ended in {job.state.name}: {job.error}")
+            print(f"📦 Gemini batch {job.name} finished")
+
+            for (_, future), result in zip(batch, job.dest.inlined_responses):
+                if result.error:
+                    print(f"Gemini batch request failed: {result.error}")
+                    future.set_result(None)
+                else:
+                    future.set_result(result.response.text)
+        except Exception as e:
+            print(f"Gemini batch failed: {e}")
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
@@ -1,4 +1,4 @@
-import requests
+from http_client import get_session
 from config import GPODDER_BASE_URL, AUTH, SINCE_TIMESTAMP
 
 def fetch_episode_actions(since=None):
@@ -9,6 +9,6 @@ def fetch_episode_actions(since=None):
     url = f"{GPODDER_BASE_URL}/api/2/episodes/{AUTH[0]}.json"
     params = {"since": timestamp}
 
-    r = requests.get(url, auth=AUTH, params=params, timeout=30)
+    r = get_session().get(url, auth=AUTH, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
@@ -0,0 +1,78 @@
+"""
+The job queue used by this node: the local SQLite database, or the shared
+queue service at queue.url when several nodes work together.
+
+Workers of this process sleep in wait_for_change() while they have nothing
+to do, and are woken as soon as this process queues or finishes a job.
+"""
+import threading
+from config import QUEUE_URL
+from state_manager import STAGES, worker_id
+
+if QUEUE_URL:
+    from queue_client import (
+        enqueue_jobs as _enqueue_jobs,
+        claim_job,
+        renew_lease,
+        finish_stage as _finish_stage,
+        fail_stage as _fail_stage,
+        count_ready,
+        queue_depths,
+        has_runnable_jobs,
+        load_last_timestamp,
+        save_last_timestamp
+    )
+else:
+    from state_manager import (
+        enqueue_jobs as _enqueue_jobs,
+        claim_job,
+        renew_lease,
+        finish_stage as _finish_stage,
+        fail_stage as _fail_stage,
+        count_ready,
+        queue_depths,
+        has_runnable_jobs,
+        load_last_timestamp,
+        save_last_timestamp
+    )
+
+_changed = threading.Condition()
+_generation = 0
+
+def notify_changed():
+    """
+    Wakes the workers waiting in wait_for_change().
+    """
+    global _generation
+    with _changed:
+        _generation += 1
+        _changed.notify_all()
+
+def generation():
+    """
+    Counter of queue changes, to pass to wait_for_change() later.
+    """
+    return _generation
+
+def wait_for_change(seen, timeout):
+    """
+    Waits until the queue changed since generation seen, or timeout seconds
+    passed (for changes made by other nodes and retry delays running out).
+    """
+    with _changed:
+        _changed.wait_for(lambda: _generation != seen, timeout)
+
+def enqueue_jobs(*args, **kwargs):
+    result = _enqueue_jobs(*args, **kwargs)
+    notify_changed()
+    return result
+
+def finish_stage(*args, **kwargs):
+    result = _finish_stage(*args, **kwargs)
+    notify_changed()
+    return result
+
+def fail_stage(*args, **kwargs):
+    result = _fail_stage(*args, **kwargs)
+    notify_changed()
+    return result
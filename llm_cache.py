@@ -0,0 +1,33 @@
+import os
+import hashlib
+import storage
+from config import LLM_PROVIDER, GEMINI_MODEL, OLLAMA_MODEL
+
+def model_name():
+    return GEMINI_MODEL if LLM_PROVIDER == "gemini" else OLLAMA_MODEL
+
+def _path(directory, template, text):
+    key = "\0".join([LLM_PROVIDER, model_name(), template, text])
+    return os.path.join(directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".md")
+
+def get(directory, template, text):
+    """
+    Returns the cached LLM response for text summarized with template by
+    the current provider and model, or None.
+    """
+    path = _path(directory, template, text)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        response = f.read()
+    storage.touch(path)
+    return response
+
+def put(directory, template, text, response):
+    os.makedirs(directory, exist_ok=True)
+    path = _path(directory, template, text)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(response)
+    os.replace(tmp_path, path)
+    storage.add(path)
@@ -1,20 +1,30 @@
 import time
 import sys
+import argparse
+import threading
+import metrics
+import storage
 from datetime import datetime
 from gpodder import fetch_episode_actions
-from utils import parse_timestamp, get_podcast_metadata, sanitize_filename
-from downloader import download_file
-from transcriber import transcribe
-from summarizer import summarize
-from state_manager import load_last_timestamp, save_last_timestamp
+from utils import coalesce_plays, barely_started
+from pipeline import run_stage_workers
+from async_runner import run_batches_forever
+from scheduler import PollScheduler, install_triggers
+from config import PIPELINE_ENGINE, NODE_ROLES
+from job_queue import STAGES, load_last_timestamp, save_last_timestamp, enqueue_jobs, queue_depths
 from version import __version__
-import os
 
-POLL_INTERVAL = 600  # 10 minutes
+# Roles that run the workers of one pipeline stage
+ROLE_STAGES = {
+    "downloader": "download",
+    "transcriber": "transcribe",
+    "summarizer": "summarize"
+}
+ROLES = ("all", "poller", "queue") + tuple(ROLE_STAGES)
 
-def process_actions(since_ts):
+def enqueue_new_plays(since_ts):
     """
-    Fetches and processes actions since the given timestamp.
+    Fetches actions since the given timestamp and queues a job per played episode.
     Returns the updated timestamp (max of current and processed actions).
     """
     try:
@@ -24,22 +34,22 @@ def process_actions(since_ts):
         return since_ts
 
     actions = data.get("actions", [])
-    plays = [a for a in actions if a.get("action") == "play"]
+    # One entry per episode and device, with the latest position
+    plays = coalesce_plays(actions)
     
     if not plays:
         print("No new 'play' actions found.")
         return since_ts
 
     # sort safely using parsed timestamp
-    plays.sort(key=lambda a: parse_timestamp(a.get("timestamp")) or datetime.min)
+    plays.sort(key=lambda p: p[0] or datetime.min)
 
-    print(f"\n🎧 New played episodes: {len(plays)}\n")
+    print(f"\n🎧 New played episodes: {len(plays)} (from {len(actions)} actions)\n")
 
     max_ts = since_ts
+    episodes = []
 
-    for a in plays:
-        raw_ts = a.get("timestamp")
-        dt = parse_timestamp(raw_ts)
+    for dt, a in plays:
         time_str = dt.isoformat() if dt else "unknown"
         episode_url = a.get('episode')
         podcast_url = a.get('podcast')
@@ -56,54 +66,106 @@ def process_actions(since_ts):
              if ts_val > max_ts:
                  max_ts = ts_val
 
-        if episode_url:
-             # Fetch metadata to determine structure
-             podcast_title, episode_title = get_podcast_metadata(podcast_url, episode_url)
-             
-             if not podcast_title:
-                 podcast_title = "Unknown Podcast"
-             if not episode_title:
-                 # fallback to extracting from URL
-                 episode_title = episode_url.split("/")[-1]
-                 if "?" in episode_title:
-                     episode_title = episode_title.split("?")[0]
-            
-             safe_podcast = sanitize_filename(podcast_title)
-             safe_episode = sanitize_filename(episode_title)
-             
-             # Ensure extension
-             if not safe_episode.lower().endswith('.mp3') and not safe_episode.lower().endswith('.m4a'):
-                  safe_episode += ".mp3" # default guess
-
-             relative_path = os.path.join(safe_podcast, safe_episode)
-             
-             filepath = download_file(episode_url, relative_path=relative_path)
-             if filepath:
-                 transcript_path = transcribe(filepath)
-                 if transcript_path:
-                     summarize(transcript_path)
-        else:
+        if not episode_url:
              print("⚠️ No episode URL found, skipping download.")
-        
+        elif barely_started(a):
+             print("⏭  Barely started, skipping.")
+        else:
+             episodes.append(a)
+
+    if episodes:
+        queued = enqueue_jobs(episodes)
+        print(f"📥 Queued {queued} new episodes")
+
     return max_ts
 
-def main():
-    print(f"🚀 Starting PodGist v{__version__} Loop...")
+def collect_queue_depths():
+    """
+    Refreshes the queue depth gauges, reporting 0 for empty stages.
+    """
+    depths = {(stage, status): 0 for stage in STAGES for status in ("pending", "running", "done", "failed")}
+    for stage, status, count in queue_depths():
+        depths[(stage, status)] = count
+    for (stage, status), count in depths.items():
+        metrics.set_gauge("podgist_queue_jobs", count, stage=stage, status=status)
+
+def parse_roles(argv):
+    parser = argparse.ArgumentParser(description="PodGist")
+    parser.add_argument(
+        "--role",
+        default=",".join(NODE_ROLES),
+        help=f"Comma-separated roles of this node: {', '.join(ROLES)} (default from node.roles)"
+    )
+    args = parser.parse_args(argv)
+    roles = [r.strip() for r in args.role.split(",") if r.strip()]
+    unknown = [r for r in roles if r not in ROLES]
+    if unknown:
+        parser.error(f"Unknown role(s): {', '.join(unknown)}")
+    return roles
+
+def poll_loop():
+    """
+    Polls gPodder forever on an adaptive schedule: often right after new
+    plays, backing off while idle. Polling never waits for the workers, so
+    new plays are queued while earlier ones are still being processed.
+    """
+    scheduler = PollScheduler()
+    install_triggers(scheduler)
+
     current_since = load_last_timestamp()
     print(f"📅 Starting check from timestamp: {current_since}")
 
+    while True:
+        started_at = time.time()
+        print(f"\nChecking for new actions (since {current_since})...")
+        new_since = enqueue_new_plays(current_since)
+        if new_since > current_since:
+            current_since = new_since
+            # The plays are queued durably, so they never need to be fetched again
+            save_last_timestamp(current_since)
+            scheduler.record(activity=True)
+        else:
+            scheduler.record(activity=False)
+
+        if scheduler.wait(started_at):
+            print("🔔 Check triggered")
+
+def start_workers(stages):
+    """
+    Starts the background workers for the given stages of this node.
+    """
+    if PIPELINE_ENGINE == "async" and list(stages) == list(STAGES):
+        target, args = run_batches_forever, ()
+    else:
+        target, args = run_stage_workers, (stages,)
+    threading.Thread(target=target, args=args, name="workers", daemon=True).start()
+
+def main(argv=None):
+    roles = parse_roles(argv)
+    print(f"🚀 Starting PodGist v{__version__} ({', '.join(roles)})...")
+
     try:
-        while True:
-            print(f"\nChecking for new actions (since {current_since})...")
-            new_since = process_actions(current_since)
-            
-            if new_since > current_since:
-                current_since = new_since
-                save_last_timestamp(current_since)
-            
-            print(f"💤 Sleeping for {POLL_INTERVAL} seconds...")
-            time.sleep(POLL_INTERVAL)
-            
+        metrics.register_collector(collect_queue_depths)
+        metrics.register_collector(storage.collect_usage)
+        metrics.start_server()
+
+        if "queue" in roles:
+            from queue_server import serve
+            threading.Thread(target=serve, name="queue", daemon=True).start()
+
+        if "all" in roles:
+            stages = list(STAGES)
+        else:
+            stages = [ROLE_STAGES[r] for r in roles if r in ROLE_STAGES]
+        if stages:
+            start_workers(stages)
+
+        if "all" in roles or "poller" in roles:
+            poll_loop()
+        else:
+            while True:
+                time.sleep(3600)
+
     except KeyboardInterrupt:
         print("\n🛑 Stopping loop. Goodbye!")
         sys.exit(0)
@@ -0,0 +1,142 @@
+import re
+import threading
+import contextlib
+import metrics
+import llm_cache
+from utils import read_template
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    LLM_PROVIDER,
+    GEMINI_BATCH_ENABLED,
+    CHUNK_PROMPT_FILE,
+    REDUCE_PROMPT_FILE,
+    CHUNK_CACHE_DIR,
+    MAP_REDUCE_CHUNK_TOKENS,
+    MAP_REDUCE_CONCURRENCY
+)
+
+# Rough average for English and most European languages
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# One limit per provider, shared by every summarization worker
+_limits = {}
+_limits_guard = threading.Lock()
+
+def batched(provider):
+    """
+    Whether prompts to provider go through the Gemini batcher, which sends
+    everything waiting as one job.
+    """
+    return provider == "gemini" and GEMINI_BATCH_ENABLED
+
+def provider_limit(provider):
+    if batched(provider):
+        # A slot would be held for the whole batch job (up to hours) and cap
+        # how many prompts one job can carry
+        return contextlib.nullcontext()
+    with _limits_guard:
+        if provider not in _limits:
+            _limits[provider] = threading.BoundedSemaphore(MAP_REDUCE_CONCURRENCY.get(provider, 2))
+        return _limits[provider]
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+def _pieces(text, budget):
+    """
+    Yields pieces of text no longer than budget tokens: lines (whisper
+    segments / paragraphs) first, then sentences, then hard cuts.
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if estimate_tokens(line) <= budget:
+            yield line
+            continue
+        for sentence in _SENTENCE_RE.split(line):
+            max_chars = budget * CHARS_PER_TOKEN
+            for i in range(0, len(sentence), max_chars):
+                yield sentence[i:i + max_chars]
+
+def split_transcript(text, budget):
+    """
+    Splits a transcript into chunks of at most budget tokens, cutting only
+    between lines or sentences where possible.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for piece in _pieces(text, budget):
+        piece_tokens = estimate_tokens(piece) + 1
+        if current and size + piece_tokens > budget:
+            chunks.append("\n".join(current))
+            current = []
+            size = 0
+        current.append(piece)
+        size += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _map_chunk(generate, template, chunk, index, total):
+    """
+    Summarizes one chunk, reusing a cached result when the same prompt
+    (template, chunk and part number) was sent before to the same provider
+    and model.
+    """
+    prompt = (template
+              .replace("{part}", str(index + 1))
+              .replace("{parts}", str(total))
+              .replace("{transcript}", chunk))
+    # Keyed on the prompt as sent: the same chunk at another position
+    # (part i of n) gets its own summary
+    cached = llm_cache.get(CHUNK_CACHE_DIR, template, prompt)
+    metrics.cache_result("summary_chunk", cached is not None)
+    if cached is not None:
+        return cached
+
+    with provider_limit(LLM_PROVIDER):
+        partial = generate(prompt)
+    if not partial:
+        return None
+    llm_cache.put(CHUNK_CACHE_DIR, template, prompt, partial)
+    return partial
+
+def summarize_long(transcript_text, generate, chunks=None):
+    """
+    Map-reduce summary of a long transcript: chunks are summarized
+    concurrently with the chunk template, then one reduce call merges the
+    partial summaries with the reduce template.
+    generate is the provider call taking a prompt and returning text or None.
+    chunks may be given already split, e.g. along whisper segments.
+    """
+    chunk_template = read_template(CHUNK_PROMPT_FILE)
+    reduce_template = read_template(REDUCE_PROMPT_FILE)
+    if chunk_template is None or reduce_template is None:
+        return None
+
+    if chunks is None:
+        chunks = split_transcript(transcript_text, MAP_REDUCE_CHUNK_TOKENS)
+    print(f"Summarizing {len(chunks)} chunks with {LLM_PROVIDER}...")
+
+    workers = MAP_REDUCE_CONCURRENCY.get(LLM_PROVIDER, 2)
+    if batched(LLM_PROVIDER):
+        # All chunks go out together, in the same batch job
+        workers = len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        partials = list(pool.map(
+            lambda args: _map_chunk(generate, chunk_template, args[1], args[0], len(chunks)),
+            enumerate(chunks)
+        ))
+
+    failed = [i for i, p in enumerate(partials) if not p]
+    if failed:
+        print(f"Failed to summarize chunks {failed}")
+        return None
+
+    summaries = "\n\n".join(f"## Part {i + 1}\n\n{p.strip()}" for i, p in enumerate(partials))
+    with provider_limit(LLM_PROVIDER):
+        return generate(reduce_template.replace("{summaries}", summaries))
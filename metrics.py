@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_HOST, METRICS_PORT, METRICS_LOG_FILE
+
+TIME_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+RATIO_BUCKETS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name: (type, help, buckets)
+METRICS = {
+    "podgist_stage_seconds": ("histogram", "Wall time of a pipeline stage per episode", TIME_BUCKETS),
+    "podgist_stage_total": ("counter", "Pipeline stage runs by outcome", None),
+    "podgist_download_bytes_total": ("counter", "Bytes downloaded from episode hosts", None),
+    "podgist_ffmpeg_seconds": ("histogram", "Time spent converting audio with ffmpeg", TIME_BUCKETS),
+    "podgist_whisper_seconds": ("histogram", "Time spent in whisper per episode", TIME_BUCKETS),
+    "podgist_audio_seconds_total": ("counter", "Seconds of audio transcribed", None),
+    "podgist_trim_audio_seconds_total": ("counter", "Seconds of audio checked for silence, by podcast", None),
+    "podgist_trim_skipped_seconds_total": ("counter", "Seconds of silence left out of transcription, by podcast", None),
+    "podgist_transcribe_realtime_factor": ("histogram", "Whisper time divided by audio duration", RATIO_BUCKETS),
+    "podgist_llm_seconds": ("histogram", "Duration of LLM requests", TIME_BUCKETS),
+    "podgist_llm_first_token_seconds": ("histogram", "Time to the first piece of a streamed LLM response", TIME_BUCKETS),
+    "podgist_llm_tokens_per_second": ("histogram", "Estimated output tokens per second of streamed LLM responses", RATE_BUCKETS),
+    "podgist_llm_prompt_chars_total": ("counter", "Characters sent to the LLM", None),
+    "podgist_llm_response_chars_total": ("counter", "Characters received from the LLM", None),
+    "podgist_llm_requests_total": ("counter", "LLM requests by outcome", None),
+    "podgist_cache_total": ("counter", "Cache lookups by cache and result (hit/miss)", None),
+    "podgist_queue_jobs": ("gauge", "Jobs in the queue by stage and status", None),
+    "podgist_storage_bytes": ("gauge", "Bytes stored per artifact class", None),
+    "podgist_evicted_bytes_total": ("counter", "Bytes evicted per artifact class", None)
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_collectors = []
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    """
+    Records a value in the histogram name.
+    """
+    buckets = METRICS[name][2]
+    with _lock:
+        key = _key(name, labels)
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+@contextmanager
+def timed(name, **labels):
+    """
+    Observes the duration of the with block in the histogram name.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start, **labels)
+
+def record_stage(job, duration, error=None):
+    """
+    Records one run of a pipeline stage for a job.
+    """
+    outcome = "ok" if error is None else "failed"
+    observe("podgist_stage_seconds", duration, stage=job["stage"])
+    inc("podgist_stage_total", stage=job["stage"], outcome=outcome)
+    log_event(
+        "stage",
+        stage=job["stage"],
+        episode=job["episode_url"],
+        attempt=job["attempts"],
+        seconds=round(duration, 3),
+        outcome=outcome,
+        error=str(error) if error is not None else None
+    )
+
+def cache_result(cache, hit):
+    inc("podgist_cache_total", cache=cache, result="hit" if hit else "miss")
+
+def register_collector(func):
+    """
+    Registers a function called on every scrape to refresh gauges,
+    e.g. queue depths.
+    """
+    _collectors.append(func)
+
+def log_event(event, **fields):
+    """
+    Appends a JSON line to the metrics log, if one is configured.
+    """
+    if not METRICS_LOG_FILE:
+        return
+    line = json.dumps(dict(ts=round(time.time(), 3), event=event, **fields), default=str)
+    with _lock:
+        log_dir = os.path.dirname(METRICS_LOG_FILE)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        with open(METRICS_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels
+    )
+    return "{" + inner + "}"
+
+def render():
+    """
+    Renders all metrics in the Prometheus text exposition format.
+    """
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f"Warning: metrics collector failed: {e}")
+
+    lines = []
+    with _lock:
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for (metric, labels), hist in _histograms.items():
+                    if metric != name:
+                        continue
+                    for bound, count in zip(buckets, hist["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {hist['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+            else:
+                values = _counters if kind == "counter" else _gauges
+                for (metric, labels), value in values.items():
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    """
+    Serves /metrics in the background if metrics.port is set.
+    """
+    if not METRICS_PORT:
+        return
+    server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"📈 Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
@@ -0,0 +1,209 @@
+import time
+import threading
+import metrics
+from utils import build_relative_path
+from downloader import download_episode
+from transcriber import transcribe
+from summarizer import summarize
+from job_queue import (
+    STAGES,
+    worker_id,
+    claim_job,
+    renew_lease,
+    finish_stage,
+    fail_stage,
+    count_ready,
+    generation,
+    wait_for_change,
+    notify_changed
+)
+from config import (
+    PIPELINE_DOWNLOAD_WORKERS,
+    PIPELINE_TRANSCRIBE_WORKERS,
+    PIPELINE_SUMMARIZE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    QUEUE_LEASE_SECONDS,
+    QUEUE_URL
+)
+
+# Idle workers are woken when this process queues or finishes a job. They
+# also look again after IDLE_WAIT seconds for retry delays that ran out.
+IDLE_WAIT = 1
+# Longest wait after the queue couldn't be reached
+QUEUE_ERROR_WAIT_MAX = 60
+# Changes made by other nodes aren't signalled, so with a remote queue idle
+# workers poll, backing off from IDLE_POLL_MIN to IDLE_WAIT seconds
+IDLE_POLL_MIN = 0.05
+
+def download_stage(job):
+    """
+    Resolves the storage path of a play action and downloads its audio.
+    Returns the path of the downloaded episode or None.
+    """
+    action = job["action"]
+    episode_url = action.get("episode")
+    relative_path = build_relative_path(action.get("podcast"), episode_url)
+    return download_episode(episode_url, relative_path)
+
+def transcribe_stage(job):
+    return transcribe(job["artifact"])
+
+def summarize_stage(job):
+    return summarize(job["artifact"])
+
+STAGE_FUNCS = {
+    "download": download_stage,
+    "transcribe": transcribe_stage,
+    "summarize": summarize_stage
+}
+
+def run_job(job, owner):
+    """
+    Runs the current stage of a leased job and records the outcome.
+    The lease is renewed in the background while the stage runs, so long
+    transcriptions are not taken over by another worker.
+    """
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(QUEUE_LEASE_SECONDS / 3):
+            try:
+                renewed = renew_lease(job, owner)
+            except Exception as e:
+                # e.g. the queue node restarting; try again next beat
+                print(f"⚠️ Could not renew lease on {job['episode_url']}: {e}")
+                continue
+            if not renewed:
+                print(f"⚠️ Lost lease on {job['episode_url']}")
+                return
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    start = time.time()
+    try:
+        result = STAGE_FUNCS[job["stage"]](job)
+        error = None if result else f"{job['stage']} returned no result"
+    except Exception as e:
+        result, error = None, e
+    finally:
+        done.set()
+
+    duration = time.time() - start
+    metrics.record_stage(job, duration, error)
+    if error is None:
+        finish_stage(job, owner, result, duration)
+    else:
+        fail_stage(job, owner, error)
+    return result
+
+def _downstream_full(stage):
+    """
+    Backpressure: downloads wait while PIPELINE_QUEUE_SIZE episodes are
+    already waiting for transcription, and transcription waits likewise for
+    summaries.
+    """
+    index = STAGES.index(stage)
+    if index + 1 >= len(STAGES):
+        return False
+    return count_ready(STAGES[index + 1]) >= PIPELINE_QUEUE_SIZE
+
+def _worker(stage, upstream_done, forever=False):
+    """
+    Claims and runs jobs of one stage until the queue has nothing left for
+    it and the upstream stages of this run have finished.
+    With forever, the worker keeps waiting for new jobs instead.
+    """
+    owner = worker_id()
+    poll = IDLE_POLL_MIN
+    error_wait = IDLE_WAIT
+    while True:
+        finished = upstream_done is None or upstream_done.is_set()
+        seen = generation()
+        try:
+            if _downstream_full(stage):
+                poll = _idle(seen, poll)
+                continue
+            job = claim_job([stage], owner)
+            if job is None:
+                if finished and not forever:
+                    break
+                poll = _idle(seen, poll)
+                continue
+            poll = IDLE_POLL_MIN
+            run_job(job, owner)
+            error_wait = IDLE_WAIT
+        except Exception as e:
+            # Keep the worker alive while the queue can't be reached;
+            # the lease of an unfinished job runs out and it is retried
+            print(f"⚠️ {stage} worker: job queue error, retrying in {error_wait:.0f}s: {e}")
+            time.sleep(error_wait)
+            error_wait = min(error_wait * 2, QUEUE_ERROR_WAIT_MAX)
+
+def _idle(seen, poll):
+    """
+    Waits for a queue change. Returns the next poll interval.
+    """
+    if QUEUE_URL:
+        wait_for_change(seen, poll)
+        return min(poll * 2, IDLE_WAIT)
+    wait_for_change(seen, IDLE_WAIT)
+    return poll
+
+def _start_stage(stage, count, upstream_done, forever=False):
+    threads = []
+    for i in range(max(1, count)):
+        t = threading.Thread(
+            target=_worker,
+            args=(stage, upstream_done, forever),
+            name=f"{stage}-{i}",
+            daemon=True
+        )
+        t.start()
+        threads.append(t)
+    return threads
+
+def run_pipeline():
+    """
+    Drains the job queue through download -> transcribe -> summarize.
+
+    Each stage has its own pool of worker threads claiming jobs of that
+    stage, so downloads, whisper and LLM calls overlap and throughput is
+    set by the slowest stage. At most PIPELINE_QUEUE_SIZE finished items
+    wait for the next stage at any time.
+    """
+    download_done = threading.Event()
+    transcribe_done = threading.Event()
+
+    downloaders = _start_stage("download", PIPELINE_DOWNLOAD_WORKERS, None)
+    transcribers = _start_stage("transcribe", PIPELINE_TRANSCRIBE_WORKERS, download_done)
+    summarizers = _start_stage("summarize", PIPELINE_SUMMARIZE_WORKERS, transcribe_done)
+
+    # Drain the stages in order so every job reaches the end
+    for t in downloaders:
+        t.join()
+    download_done.set()
+    notify_changed()
+    for t in transcribers:
+        t.join()
+    transcribe_done.set()
+    notify_changed()
+    for t in summarizers:
+        t.join()
+
+STAGE_WORKERS = {
+    "download": PIPELINE_DOWNLOAD_WORKERS,
+    "transcribe": PIPELINE_TRANSCRIBE_WORKERS,
+    "summarize": PIPELINE_SUMMARIZE_WORKERS
+}
+
+def run_stage_workers(stages):
+    """
+    Runs worker pools for the given stages indefinitely, claiming jobs as
+    other nodes produce them. Used by the role-based deployment, where each
+    node only handles some stages.
+    """
+    threads = []
+    for stage in stages:
+        print(f"🛠  Starting {STAGE_WORKERS[stage]} {stage} worker(s)")
+        threads += _start_stage(stage, STAGE_WORKERS[stage], None, forever=True)
+    for t in threads:
+        t.join()
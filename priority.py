@@ -0,0 +1,59 @@
+"""
+The order in which queued jobs are claimed, set by queue.policy:
+
+    fifo:     oldest play first
+    recent:   most recent play first
+    shortest: shortest episode first, so one long episode doesn't hold
+              back many short ones
+
+Podcasts listed in queue.podcast_priority go before all others, whatever
+the policy.
+"""
+from feed_cache import cached_enclosure_length, normalize_url
+from utils import parse_timestamp
+from config import QUEUE_POLICY, QUEUE_PODCAST_PRIORITY
+
+# Typical podcast bitrate (128 kbit/s), to turn enclosure sizes into seconds
+BYTES_PER_SECOND = 16000
+# Assumed length of episodes whose length is unknown (seconds)
+UNKNOWN_COST = 3600
+
+POLICIES = {
+    "fifo": "priority DESC, id",
+    "recent": "priority DESC, played_at DESC, id",
+    "shortest": f"priority DESC, COALESCE(cost, {UNKNOWN_COST}), id"
+}
+
+_podcast_priority = {normalize_url(url): int(value) for url, value in (QUEUE_PODCAST_PRIORITY or {}).items()}
+
+if QUEUE_POLICY not in POLICIES:
+    print(f"Warning: Unknown queue.policy '{QUEUE_POLICY}', using fifo.")
+
+def order_by():
+    """
+    Returns the ORDER BY clause of the jobs table for the configured policy.
+    """
+    return POLICIES.get(QUEUE_POLICY, POLICIES["fifo"])
+
+def estimate_cost(action):
+    """
+    Estimates the length of the played episode in seconds: the total
+    reported by gPodder, or else the enclosure size from the cached feed.
+    Returns None if neither is known.
+    """
+    try:
+        total = float(action.get("total") or 0)
+    except (TypeError, ValueError):
+        total = 0
+    if total > 0:
+        return total
+
+    length = cached_enclosure_length(action.get("podcast"), action.get("episode"))
+    return length / BYTES_PER_SECOND if length else None
+
+def played_at(action):
+    dt = parse_timestamp(action.get("timestamp"))
+    return dt.timestamp() if dt else 0
+
+def podcast_priority(podcast_url):
+    return _podcast_priority.get(normalize_url(podcast_url), 0)
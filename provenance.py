@@ -0,0 +1,41 @@
+import os
+import json
+import time
+import hashlib
+
+def meta_path(path):
+    """
+    Where the provenance of an artifact is kept: next to the stored file
+    (following the symlink of a view), as <file>.meta.
+    """
+    return os.path.realpath(path) + ".meta"
+
+def record(path, **fields):
+    """
+    Records what produced the artifact at path (e.g. model, prompt).
+    """
+    fields["created"] = int(time.time())
+    meta = meta_path(path)
+    tmp_meta = meta + ".tmp"
+    try:
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(fields, f)
+        os.replace(tmp_meta, meta)
+    except OSError as e:
+        print(f"Warning: Could not record provenance of {path}: {e}")
+
+def read(path):
+    """
+    Returns the recorded provenance of path, or {} if there is none.
+    """
+    try:
+        with open(meta_path(path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def prompt_version(template_key):
+    """
+    Short, stable version of the prompt template(s) a summary was made with.
+    """
+    return hashlib.sha256(template_key.encode("utf-8")).hexdigest()[:12]
@@ -0,0 +1,45 @@
+from http_client import get_session
+from config import QUEUE_URL, QUEUE_TOKEN
+
+def _call(method, *args, **kwargs):
+    headers = {"X-Queue-Token": QUEUE_TOKEN} if QUEUE_TOKEN else {}
+    resp = get_session().post(
+        f"{QUEUE_URL.rstrip('/')}/{method}",
+        json={"args": list(args), "kwargs": kwargs},
+        headers=headers,
+        timeout=30
+    )
+    resp.raise_for_status()
+    return resp.json()["result"]
+
+def enqueue_jobs(actions):
+    return _call("enqueue_jobs", actions)
+
+def claim_job(stages, owner):
+    return _call("claim_job", list(stages), owner)
+
+def renew_lease(job, owner):
+    return _call("renew_lease", job, owner)
+
+def finish_stage(job, owner, artifact, duration, keep_lease=False):
+    # Mirror the local store, which keeps the job's timings up to date
+    job["timings"] = dict(job["timings"], **{job["stage"]: round(duration, 3)})
+    return _call("finish_stage", job, owner, artifact, duration, keep_lease=keep_lease)
+
+def fail_stage(job, owner, error):
+    return _call("fail_stage", job, owner, str(error))
+
+def count_ready(stage):
+    return _call("count_ready", stage)
+
+def queue_depths():
+    return _call("queue_depths")
+
+def has_runnable_jobs():
+    return _call("has_runnable_jobs")
+
+def load_last_timestamp():
+    return _call("load_last_timestamp")
+
+def save_last_timestamp(timestamp):
+    return _call("save_last_timestamp", timestamp)
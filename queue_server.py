@@ -0,0 +1,82 @@
+import json
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import state_manager
+import job_queue
+from config import QUEUE_TOKEN, QUEUE_LISTEN_HOST, QUEUE_LISTEN_PORT
+
+# Job queue operations exposed to remote nodes
+METHODS = {
+    "enqueue_jobs": state_manager.enqueue_jobs,
+    "claim_job": state_manager.claim_job,
+    "renew_lease": state_manager.renew_lease,
+    "finish_stage": state_manager.finish_stage,
+    "fail_stage": state_manager.fail_stage,
+    "count_ready": state_manager.count_ready,
+    "queue_depths": state_manager.queue_depths,
+    "has_runnable_jobs": state_manager.has_runnable_jobs,
+    "load_last_timestamp": state_manager.load_last_timestamp,
+    "save_last_timestamp": state_manager.save_last_timestamp
+}
+
+# Operations after which waiting workers may find something to do
+CHANGES = {state_manager.enqueue_jobs, state_manager.finish_stage, state_manager.fail_stage}
+
+class QueueHandler(BaseHTTPRequestHandler):
+    """
+    Serves POST /<method> with a JSON body {"args": [...], "kwargs": {...}}
+    and answers {"result": ...}.
+    """
+
+    def do_POST(self):
+        if QUEUE_TOKEN and self.headers.get("X-Queue-Token") != QUEUE_TOKEN:
+            self._reply(403, {"error": "invalid token"})
+            return
+
+        method = METHODS.get(self.path.strip("/"))
+        if method is None:
+            self._reply(404, {"error": f"unknown method {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            result = method(*body.get("args", []), **body.get("kwargs", {}))
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        if method in CHANGES:
+            # Wake this node's own workers
+            job_queue.notify_changed()
+        self._reply(200, {"result": result})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep the console for job progress
+        pass
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def serve():
+    """
+    Runs the shared job queue service until interrupted.
+    """
+    if not QUEUE_TOKEN and not _is_loopback(QUEUE_LISTEN_HOST):
+        print(f"❌ Not serving the job queue on {QUEUE_LISTEN_HOST} without QUEUE_TOKEN: anyone on the network could queue downloads")
+        return
+    server = ThreadingHTTPServer((QUEUE_LISTEN_HOST, QUEUE_LISTEN_PORT), QueueHandler)
+    print(f"📬 Job queue listening on {QUEUE_LISTEN_HOST}:{QUEUE_LISTEN_PORT}")
+    server.serve_forever()
@@ -0,0 +1,75 @@
+import time
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import (
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_BACKOFF_FACTOR,
+    POLL_TRIGGER_HOST,
+    POLL_TRIGGER_PORT
+)
+
+class PollScheduler:
+    """
+    Decides when to poll gPodder next.
+
+    Right after a poll that found new plays the interval drops to
+    POLL_MIN_INTERVAL; every idle poll multiplies it by POLL_BACKOFF_FACTOR
+    up to POLL_MAX_INTERVAL. Intervals are measured from the start of the
+    previous poll, and trigger() cuts the wait short.
+    """
+
+    def __init__(self):
+        self.interval = POLL_MIN_INTERVAL
+        self.triggered = threading.Event()
+
+    def record(self, activity):
+        if activity:
+            self.interval = POLL_MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+    def wait(self, poll_started_at):
+        """
+        Sleeps until the next poll is due or a check is triggered.
+        Returns True if it was triggered.
+        """
+        remaining = poll_started_at + self.interval - time.time()
+        if remaining > 0:
+            print(f"💤 Next check in {int(remaining)} seconds...")
+        triggered = self.triggered.wait(max(0, remaining))
+        self.triggered.clear()
+        return triggered
+
+    def trigger(self):
+        self.triggered.set()
+
+def _trigger_handler(scheduler):
+    class TriggerHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip("/") != "/poll":
+                self.send_response(404)
+                self.end_headers()
+                return
+            scheduler.trigger()
+            self.send_response(202)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return TriggerHandler
+
+def install_triggers(scheduler):
+    """
+    Lets a check be forced with SIGUSR1 (kill -USR1 <pid>) or, if
+    polling.trigger_port is set, with POST /poll on that port.
+    """
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: scheduler.trigger())
+
+    if POLL_TRIGGER_PORT:
+        server = ThreadingHTTPServer((POLL_TRIGGER_HOST, POLL_TRIGGER_PORT), _trigger_handler(scheduler))
+        threading.Thread(target=server.serve_forever, name="poll-trigger", daemon=True).start()
+        print(f"🔔 Poll trigger listening on {POLL_TRIGGER_HOST}:{POLL_TRIGGER_PORT} (POST /poll)")
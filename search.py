@@ -0,0 +1,225 @@
+"""
+Full-text search over transcripts and summaries (SQLite FTS5).
+
+transcribe and summarize add their outputs to the index as they write
+them. To index an existing archive, or to query it:
+
+    python search.py --rebuild
+    python search.py "electric cars"
+    python search.py '"interest rates" NOT mortgage' --kind transcript
+"""
+import os
+import re
+import sys
+import sqlite3
+import argparse
+import threading
+import segments
+from config import SEARCH_ENABLED, SEARCH_DB, TRANSCRIPT_DIR, SUMMARY_DIR
+
+# Transcript segments are indexed in windows of about this many seconds,
+# so hits point at a moment of the episode
+WINDOW_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    podcast TEXT,
+    episode TEXT,
+    mtime REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(
+    text,
+    doc_id UNINDEXED,
+    start_ms UNINDEXED,
+    end_ms UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_local = threading.local()
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        db_dir = os.path.dirname(SEARCH_DB)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(SEARCH_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _titles(path, root, suffix):
+    """
+    Podcast and episode of an output file, from its readable path
+    "<podcast>/<episode>.mp3<suffix>" under root.
+    """
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    if rel.startswith(".."):
+        return None, os.path.basename(path)
+    podcast, _, episode = rel.partition(os.sep)
+    if not episode:
+        podcast, episode = None, podcast
+    if episode.endswith(suffix):
+        episode = episode[:-len(suffix)]
+    base, ext = os.path.splitext(episode)
+    if ext.lower() in (".mp3", ".m4a"):
+        episode = base
+    return podcast, episode
+
+def _windows(seg_path):
+    """
+    Groups the segments of a transcript into (start_ms, end_ms, text) windows.
+    """
+    with segments.SegmentFile(seg_path) as seg:
+        window = []
+        for i in range(len(seg)):
+            start, end, text = seg.segment(i)
+            if window and end - window[0][0] > WINDOW_SECONDS:
+                yield int(window[0][0] * 1000), int(window[-1][1] * 1000), " ".join(t for _, _, t in window)
+                window = []
+            window.append((start, end, text))
+        if window:
+            yield int(window[0][0] * 1000), int(window[-1][1] * 1000), " ".join(t for _, _, t in window)
+
+def _index(path, kind, root, suffix):
+    """
+    (Re-)indexes one file, unless it is indexed already and unchanged.
+    """
+    mtime = os.path.getmtime(path)
+    conn = _connect()
+    row = conn.execute("SELECT id, mtime FROM docs WHERE path = ?", (path,)).fetchone()
+    if row and row["mtime"] == mtime:
+        return False
+
+    seg_path = segments.segments_path(path) if kind == "transcript" else None
+    if seg_path:
+        entries = list(_windows(seg_path))
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            entries = [(None, None, f.read())]
+
+    podcast, episode = _titles(path, root, suffix)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if row:
+            conn.execute("DELETE FROM entries WHERE doc_id = ?", (row["id"],))
+            conn.execute("DELETE FROM docs WHERE id = ?", (row["id"],))
+        doc_id = conn.execute(
+            "INSERT INTO docs (path, kind, podcast, episode, mtime) VALUES (?, ?, ?, ?, ?)",
+            (path, kind, podcast, episode, mtime)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO entries (text, doc_id, start_ms, end_ms) VALUES (?, ?, ?, ?)",
+            [(text, doc_id, start, end) for start, end, text in entries]
+        )
+    return True
+
+def index_transcript(path):
+    """
+    Adds a transcript (a .txt under TRANSCRIPT_DIR) to the search index.
+    Never raises: a failed index update must not fail the transcription.
+    """
+    if not SEARCH_ENABLED:
+        return
+    try:
+        _index(path, "transcript", TRANSCRIPT_DIR, ".txt")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Warning: Could not index {path}: {e}")
+
+def index_summary(path):
+    """
+    Adds a summary (a .md under SUMMARY_DIR) to the search index.
+    """
+    if not SEARCH_ENABLED:
+        return
+    try:
+        _index(path, "summary", SUMMARY_DIR, ".md")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Warning: Could not index {path}: {e}")
+
+def rebuild():
+    """
+    Indexes every transcript and summary of the archive that is new or
+    changed, and drops files that no longer exist.
+    """
+    indexed = 0
+    for root, suffix, kind in ((TRANSCRIPT_DIR, ".txt", "transcript"), (SUMMARY_DIR, ".md", "summary")):
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.endswith(suffix):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        indexed += _index(path, kind, root, suffix)
+                    except (OSError, ValueError, sqlite3.Error) as e:
+                        print(f"Warning: Could not index {path}: {e}")
+
+    conn = _connect()
+    removed = 0
+    for row in conn.execute("SELECT id, path FROM docs").fetchall():
+        if not os.path.exists(row["path"]):
+            with conn:
+                conn.execute("DELETE FROM entries WHERE doc_id = ?", (row["id"],))
+                conn.execute("DELETE FROM docs WHERE id = ?", (row["id"],))
+            removed += 1
+    print(f"🔎 Indexed {indexed} new or changed files, removed {removed}")
+
+def _quote(query):
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+def search(query, kind=None, limit=20):
+    """
+    Returns the best matches for an FTS5 query as dicts with podcast,
+    episode, kind, start_ms/end_ms (None without segments), snippet and path.
+    Queries that aren't valid FTS5 syntax are searched as plain words.
+    """
+    sql = (
+        "SELECT d.podcast, d.episode, d.kind, d.path, e.start_ms, e.end_ms, "
+        "snippet(entries, 0, '[', ']', '…', 16) AS snippet "
+        "FROM entries e JOIN docs d ON d.id = e.doc_id "
+        "WHERE entries MATCH ?" + (" AND d.kind = ?" if kind else "") +
+        " ORDER BY bm25(entries) LIMIT ?"
+    )
+    conn = _connect()
+    params = [kind] if kind else []
+    try:
+        rows = conn.execute(sql, [query] + params + [limit]).fetchall()
+    except sqlite3.OperationalError:
+        rows = conn.execute(sql, [_quote(query)] + params + [limit]).fetchall()
+    return [dict(row) for row in rows]
+
+def _format_ms(ms):
+    seconds = ms // 1000
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search PodGist transcripts and summaries")
+    parser.add_argument("query", nargs="?", help="Words or an SQLite FTS5 query")
+    parser.add_argument("--kind", choices=("transcript", "summary"), help="Only search one kind of file")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="Index the existing archive first")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        rebuild()
+    if not args.query:
+        if not args.rebuild:
+            parser.error("a query or --rebuild is required")
+        return
+
+    hits = search(args.query, args.kind, args.limit)
+    if not hits:
+        print("No matches.")
+    for hit in hits:
+        at = f" @ {_format_ms(hit['start_ms'])} ({hit['start_ms']} ms)" if hit["start_ms"] is not None else ""
+        print(f"🎙 {hit['podcast'] or 'Unknown Podcast'} / {hit['episode']} [{hit['kind']}]{at}")
+        print(f"   {hit['snippet']}")
+
+if __name__ == "__main__":
+    sys.exit(main())
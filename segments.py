@@ -0,0 +1,187 @@
+"""
+Transcript segments with start and end times, stored next to a transcript
+as <transcript>.seg in a compact binary format:
+
+    header   magic "PGSEG1\\0\\0", segment count (uint32), reserved (uint32)
+    index    per segment: start ms, end ms, text offset, text length (4 x uint32)
+    texts    the UTF-8 texts of all segments, back to back
+
+Readers memory-map the file and only decode the segments they ask for, so
+a time range or a slice of a long transcript is read without loading the
+whole thing.
+"""
+import os
+import json
+import mmap
+import struct
+
+MAGIC = b"PGSEG1\0\0"
+HEADER = struct.Struct("<8sII")
+ENTRY = struct.Struct("<IIII")
+# Same estimate as the map-reduce token budget
+CHARS_PER_TOKEN = 4
+
+def _ms(timestamp):
+    """
+    Converts whisper's "HH:MM:SS,mmm" timestamps to milliseconds.
+    """
+    hms, _, ms = timestamp.replace(".", ",").partition(",")
+    h, m, s = (int(part) for part in hms.split(":"))
+    return ((h * 60 + m) * 60 + s) * 1000 + int(ms or 0)
+
+def parse_whisper_json(path, offset=0.0):
+    """
+    Reads the segments of a whisper-cli JSON output file (-oj), shifting
+    their times by offset seconds.
+    Returns a list of (start, end, text) tuples in seconds.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        data = json.load(f)
+
+    segments = []
+    for item in data.get("transcription", []):
+        if "offsets" in item:
+            start, end = item["offsets"]["from"], item["offsets"]["to"]
+        else:
+            start, end = _ms(item["timestamps"]["from"]), _ms(item["timestamps"]["to"])
+        segments.append((offset + start / 1000.0, offset + end / 1000.0, item.get("text", "").strip()))
+    return segments
+
+def parse_verbose_json(data):
+    """
+    Reads the segments of a whisper-server verbose_json response.
+    """
+    return [(s["start"], s["end"], s.get("text", "").strip()) for s in data.get("segments", [])]
+
+def write_segments(path, segments):
+    """
+    Writes (start, end, text) segments to path, atomically.
+    """
+    index = []
+    texts = []
+    offset = 0
+    for start, end, text in segments:
+        data = text.encode("utf-8")
+        index.append(ENTRY.pack(int(round(start * 1000)), int(round(end * 1000)), offset, len(data)))
+        texts.append(data)
+        offset += len(data)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(segments), 0))
+        f.write(b"".join(index))
+        f.write(b"".join(texts))
+    os.replace(tmp_path, path)
+
+def remap(path, to_original):
+    """
+    Rewrites the times of a segment file with to_original(seconds), e.g.
+    to move them from trimmed audio back to the original timeline.
+    """
+    with SegmentFile(path) as seg:
+        mapped = [(to_original(start), to_original(end), text)
+                  for start, end, text in (seg.segment(i) for i in range(len(seg)))]
+    write_segments(path, mapped)
+
+def segments_path(transcript_path):
+    """
+    Returns the segment file belonging to a transcript (following the
+    symlink into the content store), or None if there is none.
+    """
+    base = os.path.realpath(transcript_path)
+    if base.endswith(".txt"):
+        base = base[:-len(".txt")]
+    path = base + ".seg"
+    return path if os.path.exists(path) else None
+
+class SegmentFile:
+    """
+    Read-only, memory-mapped view of a .seg file.
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"Not a segment file: {path}")
+        self.texts_at = HEADER.size + self.count * ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self.map, HEADER.size + i * ENTRY.size)
+
+    def segment(self, i):
+        """
+        Returns segment i as (start, end, text), times in seconds.
+        """
+        start, end, offset, length = self._entry(i)
+        at = self.texts_at + offset
+        return start / 1000.0, end / 1000.0, self.map[at:at + length].decode("utf-8")
+
+    def text_length(self):
+        """
+        Size of all segment texts in bytes, without reading them.
+        """
+        return len(self.map) - self.texts_at
+
+    def find(self, seconds):
+        """
+        Index of the first segment ending after seconds (binary search).
+        """
+        target = seconds * 1000
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[1] <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def time_range(self, start, end):
+        """
+        Returns the segments overlapping [start, end) seconds.
+        """
+        segments = []
+        for i in range(self.find(start), self.count):
+            segment = self.segment(i)
+            if segment[0] >= end:
+                break
+            segments.append(segment)
+        return segments
+
+    def token_slices(self, budget):
+        """
+        Groups consecutive segments into slices of at most budget tokens
+        (a single longer segment makes its own slice).
+        Yields (start, end, text) per slice.
+        """
+        max_bytes = budget * CHARS_PER_TOKEN
+        slice_start, slice_end, texts, size = None, None, [], 0
+        for i in range(self.count):
+            start, end, offset, length = self._entry(i)
+            if texts and size + length > max_bytes:
+                yield slice_start / 1000.0, slice_end / 1000.0, "\n".join(texts)
+                texts, size = [], 0
+            if not texts:
+                slice_start = start
+            at = self.texts_at + offset
+            texts.append(self.map[at:at + length].decode("utf-8"))
+            slice_end = end
+            size += length
+        if texts:
+            yield slice_start / 1000.0, slice_end / 1000.0, "\n".join(texts)
@@ -1,15 +1,99 @@
 import json
 import os
-from config import SINCE_TIMESTAMP, STATE_FILE
+import time
+import socket
+import sqlite3
+import threading
+import priority
+from config import (
+    SINCE_TIMESTAMP,
+    STATE_FILE,
+    QUEUE_DB,
+    QUEUE_LEASE_SECONDS,
+    QUEUE_MAX_ATTEMPTS,
+    QUEUE_RETRY_BACKOFF,
+    QUEUE_RETRY_BACKOFF_MAX
+)
 
-def load_last_timestamp():
+# Stages in processing order. A job moves through them one by one.
+STAGES = ("download", "transcribe", "summarize")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    episode_url TEXT NOT NULL UNIQUE,
+    podcast_url TEXT,
+    action TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    artifact TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    error TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    priority INTEGER NOT NULL DEFAULT 0,
+    played_at REAL NOT NULL DEFAULT 0,
+    cost REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (stage, status, next_attempt_at);
+"""
+
+# Columns added after the first release of the jobs table
+MIGRATIONS = (
+    ("priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("played_at", "REAL NOT NULL DEFAULT 0"),
+    ("cost", "REAL")
+)
+
+def _migrate(conn):
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for name, definition in MIGRATIONS:
+        if name not in columns:
+            try:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+            except sqlite3.OperationalError:
+                # Another process added it first
+                pass
+
+_local = threading.local()
+
+def _connect():
     """
-    Loads the last timestamp from state.json.
-    If the file doesn't exist or is invalid, returns the default SINCE_TIMESTAMP from config.
+    Returns this thread's connection to the queue database.
+    WAL mode lets readers and one writer work at the same time, across
+    threads and processes.
     """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        db_dir = os.path.dirname(QUEUE_DB)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(QUEUE_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+def worker_id():
+    """
+    Identifies the current thread across hosts and processes, for leases.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+def _load_legacy_timestamp():
     if not os.path.exists(STATE_FILE):
         return SINCE_TIMESTAMP
-    
     try:
         with open(STATE_FILE, 'r') as f:
             data = json.load(f)
@@ -18,13 +102,226 @@ def load_last_timestamp():
         print(f"Warning: Could not read {STATE_FILE}. Using default SINCE_TIMESTAMP.")
         return SINCE_TIMESTAMP
 
+def load_last_timestamp():
+    """
+    Loads the last timestamp from the queue database.
+    Falls back to a legacy state.json, then to SINCE_TIMESTAMP from config.
+    """
+    row = _connect().execute("SELECT value FROM state WHERE key = 'last_timestamp'").fetchone()
+    if row is None:
+        return _load_legacy_timestamp()
+    return int(row["value"])
+
 def save_last_timestamp(timestamp):
     """
-    Saves the given timestamp to state.json.
+    Saves the given timestamp to the queue database.
     """
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump({"last_timestamp": int(timestamp)}, f)
+        _connect().execute(
+            "INSERT INTO state (key, value) VALUES ('last_timestamp', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (str(int(timestamp)),)
+        )
         print(f"State saved: last_timestamp={int(timestamp)}")
-    except IOError as e:
+    except sqlite3.Error as e:
         print(f"Error saving state: {e}")
+
+def enqueue_jobs(actions):
+    """
+    Adds one job per play action, keyed by episode URL.
+    Episodes already queued or done are left alone; a failed episode that
+    is played again is retried from its failed stage.
+    Returns the number of new or revived jobs.
+    """
+    now = time.time()
+    conn = _connect()
+    count = 0
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for action in actions:
+            cur = conn.execute(
+                "INSERT INTO jobs (episode_url, podcast_url, action, stage, status, "
+                "priority, played_at, cost, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?) "
+                "ON CONFLICT(episode_url) DO UPDATE SET "
+                "status = 'pending', attempts = 0, next_attempt_at = 0, error = NULL, updated_at = excluded.updated_at "
+                "WHERE status = 'failed'",
+                (action.get("episode"), action.get("podcast"), json.dumps(action), STAGES[0],
+                 priority.podcast_priority(action.get("podcast")), priority.played_at(action),
+                 priority.estimate_cost(action), now, now)
+            )
+            count += cur.rowcount
+    return count
+
+def _job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["action"] = json.loads(job["action"])
+    job["timings"] = json.loads(job["timings"])
+    return job
+
+def _retry_or_fail(job, now, error):
+    """
+    Decides what becomes of a job after a failed attempt: pending again
+    with exponential backoff, or failed once QUEUE_MAX_ATTEMPTS is reached.
+    Returns (status, next_attempt_at).
+    """
+    if job["attempts"] >= QUEUE_MAX_ATTEMPTS:
+        print(f"❌ Giving up on {job['episode_url']} at stage {job['stage']}: {error}")
+        return "failed", 0
+    delay = min(QUEUE_RETRY_BACKOFF * 2 ** (job["attempts"] - 1), QUEUE_RETRY_BACKOFF_MAX)
+    print(f"⚠️ {job['stage']} failed for {job['episode_url']}, retrying in {int(delay)}s: {error}")
+    return "pending", now + delay
+
+def _expire_leases(conn, stages, now):
+    """
+    Counts running jobs whose lease expired (their worker died or hung) as
+    failed attempts, so they are retried with backoff and eventually fail
+    instead of being reclaimed forever.
+    """
+    placeholders = ",".join("?" for _ in stages)
+    rows = conn.execute(
+        f"SELECT id, episode_url, stage, attempts FROM jobs WHERE stage IN ({placeholders}) "
+        "AND status = 'running' AND lease_expires_at < ?",
+        (*stages, now)
+    ).fetchall()
+    for row in rows:
+        error = "Lease expired, the worker died or hung"
+        status, next_attempt_at = _retry_or_fail(row, now, error)
+        conn.execute(
+            "UPDATE jobs SET status = ?, next_attempt_at = ?, error = ?, "
+            "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+            (status, next_attempt_at, error, now, row["id"])
+        )
+
+def claim_job(stages, owner):
+    """
+    Atomically leases the next runnable job in one of the given stages, in
+    the order of the queue.policy: a pending job whose retry time has come.
+    Running jobs whose lease expired are first counted as failed attempts.
+    Returns the job dict, or None if there is nothing to do.
+    """
+    now = time.time()
+    placeholders = ",".join("?" for _ in stages)
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _expire_leases(conn, stages, now)
+        row = conn.execute(
+            f"SELECT * FROM jobs WHERE stage IN ({placeholders}) AND "
+            "status = 'pending' AND next_attempt_at <= ? "
+            f"ORDER BY {priority.order_by()} LIMIT 1",
+            (*stages, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires_at = ?, "
+            "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (owner, now + QUEUE_LEASE_SECONDS, now, row["id"])
+        )
+    job = _job(row)
+    job["attempts"] += 1
+    return job
+
+def renew_lease(job, owner):
+    """
+    Extends the lease of a job still being worked on.
+    Returns False if the lease was lost to another worker.
+    """
+    now = time.time()
+    cur = _connect().execute(
+        "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+        "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+        (now + QUEUE_LEASE_SECONDS, now, job["id"], owner)
+    )
+    return cur.rowcount == 1
+
+def finish_stage(job, owner, artifact, duration, keep_lease=False):
+    """
+    Records a finished stage and hands the job to the next one, with
+    artifact (the file produced) as its input.
+    With keep_lease, the caller goes on with the next stage itself instead
+    of releasing the job to the queue.
+    """
+    now = time.time()
+    timings = dict(job["timings"], **{job["stage"]: round(duration, 3)})
+    job["timings"] = timings
+    lease_owner, lease_expires_at, attempts = None, None, 0
+
+    index = STAGES.index(job["stage"])
+    if index + 1 >= len(STAGES):
+        stage, status = job["stage"], "done"
+    elif keep_lease:
+        stage, status = STAGES[index + 1], "running"
+        lease_owner, lease_expires_at, attempts = owner, now + QUEUE_LEASE_SECONDS, 1
+    else:
+        stage, status = STAGES[index + 1], "pending"
+
+    _connect().execute(
+        "UPDATE jobs SET stage = ?, status = ?, artifact = ?, attempts = ?, next_attempt_at = 0, "
+        "lease_owner = ?, lease_expires_at = ?, error = NULL, timings = ?, updated_at = ? "
+        "WHERE id = ? AND lease_owner = ?",
+        (stage, status, artifact, attempts, lease_owner, lease_expires_at,
+         json.dumps(timings), now, job["id"], owner)
+    )
+
+def fail_stage(job, owner, error):
+    """
+    Records a failed attempt. The job is retried with exponential backoff
+    until QUEUE_MAX_ATTEMPTS is reached, then marked failed.
+    """
+    now = time.time()
+    status, next_attempt_at = _retry_or_fail(job, now, error)
+
+    _connect().execute(
+        "UPDATE jobs SET status = ?, next_attempt_at = ?, error = ?, "
+        "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+        "WHERE id = ? AND lease_owner = ?",
+        (status, next_attempt_at, str(error), now, job["id"], owner)
+    )
+
+def count_jobs(stages, statuses=("pending", "running")):
+    """
+    Counts jobs in the given stages and statuses.
+    """
+    stage_marks = ",".join("?" for _ in stages)
+    status_marks = ",".join("?" for _ in statuses)
+    row = _connect().execute(
+        f"SELECT COUNT(*) FROM jobs WHERE stage IN ({stage_marks}) AND status IN ({status_marks})",
+        (*stages, *statuses)
+    ).fetchone()
+    return row[0]
+
+def queue_depths():
+    """
+    Returns the number of jobs per stage and status, as
+    [[stage, status, count], ...].
+    """
+    rows = _connect().execute(
+        "SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status"
+    ).fetchall()
+    return [list(row) for row in rows]
+
+def count_ready(stage):
+    """
+    Counts jobs waiting in a stage that could start right now.
+    """
+    row = _connect().execute(
+        "SELECT COUNT(*) FROM jobs WHERE stage = ? AND status = 'pending' AND next_attempt_at <= ?",
+        (stage, time.time())
+    ).fetchone()
+    return row[0]
+
+def has_runnable_jobs():
+    """
+    True if any job can be claimed right now.
+    """
+    now = time.time()
+    row = _connect().execute(
+        "SELECT 1 FROM jobs WHERE (status = 'pending' AND next_attempt_at <= ?) "
+        "OR (status = 'running' AND lease_expires_at < ?) LIMIT 1",
+        (now, now)
+    ).fetchone()
+    return row is not None
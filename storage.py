@@ -0,0 +1,259 @@
+"""
+Disk budgets for the artifacts PodGist keeps.
+
+Every stored file is accounted for in a small SQLite index (size, class,
+creation and last use), so usage per class is one query instead of a walk
+over the tree. Audio becomes evictable once it has been transcribed, cache
+entries always are. When a class goes over its budget, or a download
+wouldn't fit on the disk, evictable files are deleted, least recently
+used (or oldest) first.
+
+    python storage.py            # usage per class
+    python storage.py --rebuild  # re-index the tree (also done on first use)
+    python storage.py --evict    # enforce all budgets now
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import threading
+import metrics
+import content_store
+from config import (
+    STORAGE_DB,
+    STORAGE_BUDGETS,
+    STORAGE_MIN_FREE,
+    STORAGE_EVICTION,
+    STORE_DIR,
+    LLM_CACHE_DIR,
+    CHUNK_CACHE_DIR
+)
+
+# Artifact classes and where they live
+CLASSES = {
+    "audio": content_store.AUDIO_DIR,
+    "transcripts": content_store.TRANSCRIPTS_DIR,
+    "summaries": content_store.SUMMARIES_DIR,
+    "llm_cache": LLM_CACHE_DIR,
+    "chunk_cache": CHUNK_CACHE_DIR
+}
+# Classes whose files can be evicted as soon as they are stored
+ALWAYS_EVICTABLE = {"llm_cache", "chunk_cache"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    class TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    evictable INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_files_eviction ON files (class, evictable, accessed);
+"""
+
+_local = threading.local()
+# Evictions are decided by one thread at a time
+_evict_lock = threading.Lock()
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        db_dir = os.path.dirname(STORAGE_DB)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        new = not os.path.exists(STORAGE_DB)
+        conn = sqlite3.connect(STORAGE_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+        if new:
+            rebuild()
+    return conn
+
+def classify(path):
+    """
+    Returns the artifact class of a stored file, or None.
+    """
+    directory = os.path.dirname(os.path.realpath(path))
+    for name, class_dir in CLASSES.items():
+        if directory == os.path.realpath(class_dir):
+            return name
+    return None
+
+def _transcribed(audio_path):
+    content = content_store.content_hash(audio_path)
+    return bool(content) and os.path.exists(content_store.transcript_path(content))
+
+def add(*paths):
+    """
+    Accounts for newly written files (missing ones and files outside the
+    artifact classes are ignored), then enforces the budget of their class.
+    """
+    classes = set()
+    now = time.time()
+    rows = []
+    for path in paths:
+        name = classify(path) if path else None
+        if not name or not os.path.exists(path):
+            continue
+        evictable = name in ALWAYS_EVICTABLE or (name == "audio" and _transcribed(path))
+        rows.append((os.path.realpath(path), name, os.path.getsize(path), now, now, int(evictable)))
+        classes.add(name)
+    if not rows:
+        return
+    try:
+        _connect().executemany(
+            "INSERT INTO files (path, class, size, created, accessed, evictable) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, accessed = excluded.accessed, "
+            "evictable = excluded.evictable",
+            rows
+        )
+        for name in classes:
+            enforce(name)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not update the storage index: {e}")
+
+def touch(path):
+    """
+    Marks a stored file as used, for LRU eviction.
+    """
+    try:
+        _connect().execute("UPDATE files SET accessed = ? WHERE path = ?", (time.time(), os.path.realpath(path)))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not update the storage index: {e}")
+
+def release_audio(audio_path):
+    """
+    Makes stored audio evictable once its transcript exists.
+    """
+    try:
+        _connect().execute("UPDATE files SET evictable = 1 WHERE path = ?", (os.path.realpath(audio_path),))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not update the storage index: {e}")
+
+def usage():
+    """
+    Returns {class: bytes used} from the index.
+    """
+    rows = _connect().execute("SELECT class, SUM(size) FROM files GROUP BY class").fetchall()
+    used = {name: 0 for name in CLASSES}
+    used.update({name: size or 0 for name, size in rows})
+    return used
+
+def _evict(name, needed):
+    """
+    Deletes evictable files of class name until needed bytes are freed.
+    Returns the bytes freed.
+    """
+    order = "accessed" if STORAGE_EVICTION == "lru" else "created"
+    conn = _connect()
+    freed = 0
+    rows = conn.execute(
+        f"SELECT path, size FROM files WHERE class = ? AND evictable = 1 ORDER BY {order}", (name,)
+    ).fetchall()
+    for path, size in rows:
+        if freed >= needed:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not evict {path}: {e}")
+            continue
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        freed += size
+        metrics.inc("podgist_evicted_bytes_total", size, **{"class": name})
+    if freed:
+        print(f"🧹 Evicted {freed / 1e6:.1f} MB of {name}")
+    return freed
+
+def enforce(name):
+    """
+    Evicts files of class name until it is within its budget.
+    """
+    budget = STORAGE_BUDGETS.get(name)
+    if budget is None:
+        return
+    with _evict_lock:
+        over = usage()[name] - budget
+        if over > 0:
+            _evict(name, over)
+
+def ensure_space(size):
+    """
+    Makes room for a download of size bytes: within the audio budget, and
+    with STORAGE_MIN_FREE bytes left on the disk afterwards. Transcribed
+    audio is evicted as needed.
+    Raises IOError if the download still wouldn't fit.
+    """
+    if not size:
+        return
+    with _evict_lock:
+        budget = STORAGE_BUDGETS.get("audio")
+        if budget is not None:
+            over = usage()["audio"] + size - budget
+            if over > 0 and _evict("audio", over) < over:
+                raise IOError(f"Audio budget of {budget} bytes exceeded and no transcribed audio left to evict")
+
+        os.makedirs(STORE_DIR, exist_ok=True)
+        short = size + STORAGE_MIN_FREE - shutil.disk_usage(STORE_DIR).free
+        if short > 0 and _evict("audio", short) < short:
+            raise IOError(f"Not enough disk space for {size} bytes (keeping {STORAGE_MIN_FREE} bytes free)")
+
+def rebuild():
+    """
+    Re-indexes all artifact directories from the file system.
+    """
+    conn = _connect()
+    rows = []
+    for name, directory in CLASSES.items():
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or entry.name.endswith((".tmp", ".part")):
+                continue
+            stat = entry.stat()
+            evictable = name in ALWAYS_EVICTABLE or (name == "audio" and _transcribed(entry.path))
+            rows.append((os.path.realpath(entry.path), name, stat.st_size, stat.st_mtime,
+                         max(stat.st_atime, stat.st_mtime), int(evictable)))
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM files")
+        conn.executemany(
+            "INSERT INTO files (path, class, size, created, accessed, evictable) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+    print(f"📦 Indexed {len(rows)} stored files")
+
+def collect_usage():
+    """
+    Refreshes the storage gauges (a metrics collector).
+    """
+    for name, size in usage().items():
+        metrics.set_gauge("podgist_storage_bytes", size, **{"class": name})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PodGist storage usage and eviction")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index the stored files")
+    parser.add_argument("--evict", action="store_true", help="Enforce all budgets now")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        rebuild()
+    if args.evict:
+        for name in CLASSES:
+            enforce(name)
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    for name, size in usage().items():
+        budget = STORAGE_BUDGETS.get(name)
+        limit = f" of {budget / 1e9:.2f} GB" if budget is not None else ""
+        print(f"{name:12} {size / 1e9:8.2f} GB{limit}")
+    print(f"{'free':12} {shutil.disk_usage(STORE_DIR).free / 1e9:8.2f} GB on disk")
+
+if __name__ == "__main__":
+    sys.exit(main())
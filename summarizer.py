@@ -1,17 +1,67 @@
 import os
+import time
 import requests
 import json
+import queue
+import threading
+import metrics
+import llm_cache
+import segments
+import search
+import provenance
+import storage
+import content_store
+from http_client import get_session
 from google import genai
+from gemini_batch import GeminiBatcher
+from utils import read_template
 from config import (
     GEMINI_API_KEY, 
     SUMMARY_DIR, 
     PROMPT_FILE, 
+    CHUNK_PROMPT_FILE,
+    REDUCE_PROMPT_FILE,
     TRANSCRIPT_DIR,
     LLM_PROVIDER,
     GEMINI_MODEL,
     OLLAMA_BASE_URL,
-    OLLAMA_MODEL
+    OLLAMA_MODEL,
+    MAP_REDUCE_ENABLED,
+    MAP_REDUCE_CHUNK_TOKENS,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_DIR,
+    GEMINI_BATCH_ENABLED,
+    LLM_STREAM,
+    LLM_CONNECT_TIMEOUT,
+    LLM_FIRST_TOKEN_TIMEOUT,
+    LLM_TOTAL_TIMEOUT
 )
+from map_reduce import summarize_long, estimate_tokens
+
+_gemini_client = None
+_gemini_batcher = None
+_gemini_lock = threading.Lock()
+
+def gemini_client():
+    """
+    Returns the Gemini client, created once and shared by all workers.
+    """
+    global _gemini_client
+    with _gemini_lock:
+        if _gemini_client is None:
+            _gemini_client = genai.Client(
+                api_key=GEMINI_API_KEY,
+                http_options={"timeout": int(LLM_TOTAL_TIMEOUT * 1000)}
+            )
+        return _gemini_client
+
+def gemini_batcher():
+    global _gemini_batcher
+    client = gemini_client()
+    with _gemini_lock:
+        if _gemini_batcher is None:
+            _gemini_batcher = GeminiBatcher(client)
+        return _gemini_batcher
 
 def summarize_with_gemini(prompt):
     """
@@ -22,8 +72,7 @@ def summarize_with_gemini(prompt):
         return None
 
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
+        response = gemini_client().models.generate_content(
             model=GEMINI_MODEL, 
             contents=prompt
         )
@@ -32,6 +81,16 @@ def summarize_with_gemini(prompt):
         print(f"Gemini summarization failed: {e}")
         return None
 
+def summarize_with_gemini_batch(prompt):
+    """
+    Summarizes the prompt as part of a Gemini batch job.
+    Blocks until the batch it went out with has finished.
+    """
+    if not GEMINI_API_KEY:
+        print("GEMINI_API_KEY is not set.")
+        return None
+    return gemini_batcher().submit(prompt).result()
+
 def summarize_with_ollama(prompt):
     """
     Summarizes the prompt using Ollama.
@@ -44,7 +103,7 @@ def summarize_with_ollama(prompt):
     }
     
     try:
-        response = requests.post(url, json=payload)
+        response = get_session().post(url, json=payload, timeout=(LLM_CONNECT_TIMEOUT, LLM_TOTAL_TIMEOUT))
         response.raise_for_status()
         data = response.json()
         return data.get("response")
@@ -55,13 +114,201 @@ def summarize_with_ollama(prompt):
         print(f"Ollama summarization failed: {e}")
         return None
 
+def gemini_pieces(prompt):
+    """
+    Yields the text of a Gemini response as it is generated.
+    """
+    for chunk in gemini_client().models.generate_content_stream(model=GEMINI_MODEL, contents=prompt):
+        if chunk.text:
+            yield chunk.text
+
+def ollama_pieces(prompt, streams):
+    """
+    Yields the text of an Ollama response as it is generated.
+    The open response is added to streams, so it can be closed from
+    another thread.
+    """
+    url = f"{OLLAMA_BASE_URL.rstrip('/')}/api/generate"
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True
+    }
+    # The read timeout bounds the wait for every piece, the first one included
+    timeout = (LLM_CONNECT_TIMEOUT, max(LLM_FIRST_TOKEN_TIMEOUT, 1))
+    with get_session().post(url, json=payload, stream=True, timeout=timeout) as response:
+        streams.append(response)
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(data["error"])
+            if data.get("response"):
+                yield data["response"]
+            if data.get("done"):
+                return
+
+def with_timeouts(pieces, streams=()):
+    """
+    Yields from the pieces generator, run in a background thread, and
+    raises TimeoutError if the first piece takes longer than
+    LLM_FIRST_TOKEN_TIMEOUT or all of them longer than LLM_TOTAL_TIMEOUT.
+
+    When it stops early, the responses in streams are closed, which ends
+    a read blocked in the background thread and the generation on the
+    backend's side. A generator that yields again after that is stopped
+    at its next piece.
+    """
+    q = queue.Queue()
+    cancel = threading.Event()
+
+    def produce():
+        try:
+            for piece in pieces:
+                if cancel.is_set():
+                    break
+                q.put(("piece", piece))
+            q.put(("done", None))
+        except Exception as e:
+            q.put(("error", e))
+        finally:
+            # Releases the HTTP response of a generator stopped early
+            pieces.close()
+
+    threading.Thread(target=produce, name="llm-stream", daemon=True).start()
+    start = time.time()
+    first = True
+    try:
+        while True:
+            remaining = LLM_TOTAL_TIMEOUT - (time.time() - start)
+            if first:
+                remaining = min(remaining, LLM_FIRST_TOKEN_TIMEOUT)
+            try:
+                kind, value = q.get(timeout=max(0, remaining))
+            except queue.Empty:
+                if first:
+                    raise TimeoutError(f"no output after {LLM_FIRST_TOKEN_TIMEOUT:.0f}s")
+                raise TimeoutError(f"generation took longer than {LLM_TOTAL_TIMEOUT:.0f}s")
+            if kind == "error":
+                raise value
+            if kind == "done":
+                return
+            first = False
+            yield value
+    finally:
+        cancel.set()
+        for stream in list(streams):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+def stream_generate(prompt, output_path=None):
+    """
+    Streams the response to prompt. With output_path, pieces are written
+    to a temporary file as they arrive, which is renamed to output_path
+    once the response is complete.
+    Returns (text, seconds to the first piece), or (None, None) on failure.
+    """
+    streams = []
+    pieces = gemini_pieces(prompt) if LLM_PROVIDER == "gemini" else ollama_pieces(prompt, streams)
+    part_path = output_path + ".part" if output_path else None
+    start = time.time()
+    first_token = None
+    text = []
+    try:
+        out = open(part_path, "w", encoding="utf-8") if part_path else None
+        try:
+            for piece in with_timeouts(pieces, streams):
+                if first_token is None:
+                    first_token = time.time() - start
+                text.append(piece)
+                if out:
+                    out.write(piece)
+                    out.flush()
+        finally:
+            if out:
+                out.close()
+        if not text:
+            raise RuntimeError("empty response")
+        if part_path:
+            os.replace(part_path, output_path)
+        return "".join(text), first_token
+    except Exception as e:
+        print(f"{LLM_PROVIDER} streaming failed: {e}")
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        return None, None
+
+def save_text(output_path, text):
+    """
+    Writes text to output_path atomically.
+    """
+    tmp_path = output_path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, output_path)
+
+def generate(prompt, output_path=None):
+    """
+    Sends the prompt to the configured LLM provider and returns the text.
+    With output_path, the text is also saved there (written as it arrives
+    when llm.stream is on).
+    """
+    if LLM_PROVIDER == "gemini":
+        call = summarize_with_gemini_batch if GEMINI_BATCH_ENABLED else summarize_with_gemini
+    elif LLM_PROVIDER == "ollama":
+        call = summarize_with_ollama
+    else:
+        print(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+        return None
+
+    start = time.time()
+    first_token = None
+    if LLM_STREAM and not (LLM_PROVIDER == "gemini" and GEMINI_BATCH_ENABLED):
+        text, first_token = stream_generate(prompt, output_path)
+    else:
+        text = call(prompt)
+        if text and output_path:
+            try:
+                save_text(output_path, text)
+            except OSError as e:
+                print(f"Error saving summary: {e}")
+                text = None
+    duration = time.time() - start
+    outcome = "ok" if text else "failed"
+    # Tokens are estimated from the output length, like the map-reduce budget
+    tokens_per_second = None
+    if text and first_token is not None and duration > first_token:
+        tokens_per_second = estimate_tokens(text) / (duration - first_token)
+        metrics.observe("podgist_llm_first_token_seconds", first_token, provider=LLM_PROVIDER)
+        metrics.observe("podgist_llm_tokens_per_second", tokens_per_second, provider=LLM_PROVIDER)
+    metrics.observe("podgist_llm_seconds", duration, provider=LLM_PROVIDER)
+    metrics.inc("podgist_llm_requests_total", provider=LLM_PROVIDER, outcome=outcome)
+    metrics.inc("podgist_llm_prompt_chars_total", len(prompt), provider=LLM_PROVIDER)
+    metrics.inc("podgist_llm_response_chars_total", len(text or ""), provider=LLM_PROVIDER)
+    metrics.log_event(
+        "llm",
+        provider=LLM_PROVIDER,
+        seconds=round(duration, 3),
+        prompt_chars=len(prompt),
+        response_chars=len(text or ""),
+        first_token_seconds=round(first_token, 3) if first_token is not None else None,
+        tokens_per_second=round(tokens_per_second, 1) if tokens_per_second else None,
+        outcome=outcome
+    )
+    return text
+
 def summarize(transcript_path):
     """
     Summarizes the given transcript file using the configured LLM provider.
+    Returns the summary path, or None if no summary could be made.
     """
     if not transcript_path or not os.path.exists(transcript_path):
         print(f"Transcript not found: {transcript_path}")
-        return
+        return None
 
     # Determine relative path to maintain structure
     try:
@@ -80,11 +327,64 @@ def summarize(transcript_path):
     
     output_filename = rel_path + ".md"
     output_path = os.path.join(SUMMARY_DIR, output_filename)
+    content = content_store.content_hash(transcript_path)
+
+    if content and content_store.is_legacy_file(output_path):
+        # Summarized before the content store existed
+        with content_store.key_lock(content):
+            stored = content_store.adopt(output_path, content_store.summary_path(content))
+        if stored:
+            storage.add(stored, provenance.meta_path(stored))
 
     if os.path.exists(output_path):
         print(f"Summary already exists: {output_path}")
-        return
+        search.index_summary(output_path)
+        return output_path
+
+    if not content:
+        if not write_summary(transcript_path, output_path):
+            return None
+        search.index_summary(output_path)
+        return output_path
+
+    # Stored transcripts are summarized once per content hash
+    stored = content_store.summary_path(content)
+    with content_store.key_lock(content):
+        metrics.cache_result("summary", os.path.exists(stored))
+        if os.path.exists(stored):
+            print(f"Summary already exists for identical audio: {stored}")
+        elif not write_summary(transcript_path, stored):
+            return None
+    summary = content_store.link_view(stored, output_path)
+    search.index_summary(summary)
+    return summary
+
+def segment_chunks(transcript_path):
+    """
+    Splits a transcript for map-reduce along its whisper segments, read
+    from the memory-mapped segment file. Returns None if there is none.
+    """
+    seg_path = segments.segments_path(transcript_path)
+    if not seg_path:
+        return None
+    with segments.SegmentFile(seg_path) as seg:
+        return [text for _, _, text in seg.token_slices(MAP_REDUCE_CHUNK_TOKENS)]
+
+def summary_templates(long_transcript):
+    """
+    Returns the prompt templates a summary is made with: the chunk and
+    reduce prompts for map-reduce, otherwise the prompt file.
+    Templates are cached until their file changes; None if one can't be read.
+    """
+    if long_transcript:
+        return [read_template(CHUNK_PROMPT_FILE), read_template(REDUCE_PROMPT_FILE)]
+    return [read_template(PROMPT_FILE)]
 
+def write_summary(transcript_path, output_path):
+    """
+    Generates the summary of transcript_path and writes it to output_path.
+    Returns True on success.
+    """
     # Ensure output dir
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
@@ -94,40 +394,43 @@ def summarize(transcript_path):
             transcript_text = f.read()
     except Exception as e:
         print(f"Error reading transcript: {e}")
-        return
-
-    # Read prompt
-    if not os.path.exists(PROMPT_FILE):
-        print(f"Prompt file not found: {PROMPT_FILE}")
-        return
+        return False
 
-    try:
-        with open(PROMPT_FILE, "r", encoding="utf-8") as f:
-            prompt_template = f.read()
-    except Exception as e:
-        print(f"Error reading prompt file: {e}")
-        return
-
-    # Construct prompt
-    prompt = prompt_template.replace("{transcript}", transcript_text)
-
-    print(f"Summarizing {os.path.basename(transcript_path)} using {LLM_PROVIDER}...")
+    long_transcript = MAP_REDUCE_ENABLED and estimate_tokens(transcript_text) > MAP_REDUCE_CHUNK_TOKENS
+    templates = summary_templates(long_transcript)
+    if None in templates:
+        return False
+    # The cache key covers every template the summary depends on
+    template_key = "\0".join(templates)
 
     summary_text = None
-    if LLM_PROVIDER == "gemini":
-        summary_text = summarize_with_gemini(prompt)
-    elif LLM_PROVIDER == "ollama":
-        summary_text = summarize_with_ollama(prompt)
+    saved = False
+    if LLM_CACHE_ENABLED:
+        summary_text = llm_cache.get(LLM_CACHE_DIR, template_key, transcript_text)
+        metrics.cache_result("llm", summary_text is not None)
+    if summary_text is not None:
+        print(f"Reusing cached summary of {os.path.basename(transcript_path)}")
     else:
-        print(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
-        return
+        print(f"Summarizing {os.path.basename(transcript_path)} using {LLM_PROVIDER}...")
+        if long_transcript:
+            summary_text = summarize_long(transcript_text, generate, segment_chunks(transcript_path))
+        else:
+            # Construct prompt; generate saves the summary as it arrives
+            summary_text = generate(templates[0].replace("{transcript}", transcript_text), output_path)
+            saved = bool(summary_text)
+        if summary_text and LLM_CACHE_ENABLED:
+            llm_cache.put(LLM_CACHE_DIR, template_key, transcript_text, summary_text)
 
-    if summary_text:
+    if not summary_text:
+        print("Failed to generate summary.")
+        return False
+    if not saved:
         try:
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(summary_text)
-            print(f"Summary saved to {output_path}")
+            save_text(output_path, summary_text)
         except Exception as e:
             print(f"Error saving summary: {e}")
-    else:
-        print("Failed to generate summary.")
+            return False
+    provenance.record(output_path, provider=LLM_PROVIDER, model=llm_cache.model_name(), prompt=provenance.prompt_version(template_key))
+    storage.add(output_path, provenance.meta_path(output_path))
+    print(f"Summary saved to {output_path}")
+    return True
@@ -1,8 +1,41 @@
 import os
+import time
+import wave
 import subprocess
-import requests
+import metrics
+import content_store
+from http_client import get_session
 import shutil
-from config import WHISPER_ROOT, WHISPER_MODEL, WHISPER_MODEL_PATH, TRANSCRIPT_DIR, WHISPER_BIN, DOWNLOAD_DIR
+import hashlib
+import tempfile
+import chunking
+import segments
+import search
+import provenance
+import storage
+from whisper_server import transcribe_with_server
+from config import (
+    WHISPER_ROOT,
+    WHISPER_MODEL,
+    WHISPER_MODEL_PATH,
+    TRANSCRIPT_DIR,
+    WHISPER_BIN,
+    DOWNLOAD_DIR,
+    WHISPER_THREADS,
+    PIPELINE_TRANSCRIBE_WORKERS,
+    WHISPER_AUDIO_INPUT,
+    WHISPER_SCRATCH_DIR,
+    WHISPER_CHUNKS,
+    WHISPER_CHUNK_MIN_DURATION,
+    WHISPER_SILENCE_DB,
+    WHISPER_SILENCE_MIN_DURATION,
+    WHISPER_TRIM_SILENCE,
+    WHISPER_TRIM_SILENCE_DB,
+    WHISPER_TRIM_MIN_SILENCE,
+    WHISPER_TRIM_PADDING,
+    WHISPER_BACKEND,
+    WHISPER_SEGMENTS
+)
 
 def download_model_if_needed():
     """
@@ -20,7 +53,7 @@ def download_model_if_needed():
     url = f"https://huggingface.co/ggerganov/whisper.cpp/resolve/main/ggml-{WHISPER_MODEL}.bin"
     
     try:
-        with requests.get(url, stream=True, timeout=60) as r:
+        with get_session().get(url, stream=True, timeout=60) as r:
             r.raise_for_status()
             with open(WHISPER_MODEL_PATH, 'wb') as f:
                 shutil.copyfileobj(r.raw, f)
@@ -32,30 +65,93 @@ def download_model_if_needed():
             os.remove(WHISPER_MODEL_PATH)
         raise
 
-def convert_to_wav_16k(input_path):
+def whisper_threads(workers=PIPELINE_TRANSCRIBE_WORKERS):
     """
-    Converts input audio to 16kHz WAV using ffmpeg.
-    Returns a tuple (path to the wav file, boolean indicating if it was newly created).
+    Returns the number of threads each whisper-cli process should use.
+    Defaults to splitting the cores between the transcription workers.
     """
-    output_path = input_path + ".wav"
-    
-    if os.path.exists(output_path):
-        print(f"WAV file already exists, skipping conversion: {output_path}")
-        return output_path, False
-    
-    cmd = [
+    if WHISPER_THREADS:
+        return int(WHISPER_THREADS)
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def ffmpeg_command(input_path, output):
+    """
+    Builds the ffmpeg command that decodes input_path to 16kHz mono WAV.
+    output may be "-" to write to stdout.
+    """
+    return [
         "ffmpeg",
         "-y",             # overwrite
         "-i", input_path,
         "-ar", "16000",   # 16kHz sample rate
         "-ac", "1",       # mono
         "-c:a", "pcm_s16le",
-        output_path
+        "-f", "wav",
+        output
     ]
+
+def whisper_command(wav_path, output_base, threads=None):
+    """
+    Builds the whisper-cli command. wav_path may be "-" to read from stdin.
+    """
+    cmd = [
+        WHISPER_BIN,
+        "-m", WHISPER_MODEL_PATH,
+        "-f", wav_path,
+        "-l", "auto",      # auto-detect language
+        "-t", str(threads or whisper_threads()),
+        "-otxt",           # output text file
+        "-of", output_base # output file prefix
+    ]
+    if WHISPER_SEGMENTS:
+        cmd.append("-oj")  # JSON with segment timestamps
+    return cmd
+
+def save_segments(output_base, sources):
+    """
+    Converts whisper-cli JSON outputs into output_base.seg and removes them.
+    sources is a list of (output base of a whisper run, offset in seconds).
+    """
+    if not WHISPER_SEGMENTS:
+        return
+    parsed = []
+    try:
+        for base, offset in sources:
+            parsed += segments.parse_whisper_json(base + ".json", offset)
+        segments.write_segments(output_base + ".seg", parsed)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Could not save segments for {output_base}: {e}")
+    finally:
+        for base, _ in sources:
+            if os.path.exists(base + ".json"):
+                os.remove(base + ".json")
+
+def scratch_wav_path(input_path):
+    """
+    Returns where the 16kHz WAV of input_path is written: next to the
+    audio, or in whisper.scratch_dir (e.g. a tmpfs like /dev/shm) if set.
+    """
+    if not WHISPER_SCRATCH_DIR:
+        return input_path + ".wav"
+    os.makedirs(WHISPER_SCRATCH_DIR, exist_ok=True)
+    name = hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()
+    return os.path.join(WHISPER_SCRATCH_DIR, name + ".wav")
+
+def convert_to_wav_16k(input_path):
+    """
+    Converts input audio to 16kHz WAV using ffmpeg.
+    Returns a tuple (path to the wav file, boolean indicating if it was newly created).
+    """
+    output_path = scratch_wav_path(input_path)
+    
+    if os.path.exists(output_path):
+        print(f"WAV file already exists, skipping conversion: {output_path}")
+        return output_path, False
     
     # Run ffmpeg silently
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with metrics.timed("podgist_ffmpeg_seconds"):
+            subprocess.run(ffmpeg_command(input_path, output_path), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return output_path, True
     except subprocess.CalledProcessError as e:
         print(f"FFmpeg conversion failed: {e}")
@@ -87,14 +183,59 @@ def transcribe(audio_path):
     os.makedirs(os.path.dirname(output_base), exist_ok=True)
 
     expected_output = output_base + ".txt"
+    content = content_store.content_hash(audio_path)
+
+    if content and content_store.is_legacy_file(expected_output):
+        # Transcribed before the content store existed
+        with content_store.key_lock(content):
+            stored = content_store.adopt(expected_output, content_store.transcript_path(content))
+        if stored:
+            storage.add(stored, stored[:-len(".txt")] + ".seg", provenance.meta_path(stored))
+            storage.release_audio(audio_path)
 
     if os.path.exists(expected_output):
         print(f"Transcript already exists: {expected_output}")
+        search.index_transcript(expected_output)
         return expected_output
 
+    if not content:
+        transcript = run_whisper(audio_path, output_base, rel_path)
+        if transcript:
+            search.index_transcript(transcript)
+        return transcript
+
+    # Stored audio is transcribed once per content hash, whatever its title
+    stored = content_store.transcript_path(content)
+    with content_store.key_lock(content):
+        metrics.cache_result("transcript", os.path.exists(stored))
+        if os.path.exists(stored):
+            print(f"Transcript already exists for identical audio: {stored}")
+        elif not run_whisper(audio_path, stored[:-len(".txt")], rel_path):
+            return None
+    transcript = content_store.link_view(stored, expected_output)
+    search.index_transcript(transcript)
+    return transcript
+
+def run_whisper(audio_path, output_base, label, threads=None):
+    """
+    Converts audio_path and runs whisper.cpp on it, writing output_base.txt.
+    threads is the whisper thread count, by default whisper_threads().
+    Returns the transcript path or None.
+    """
+    threads = threads or whisper_threads()
+    os.makedirs(os.path.dirname(output_base), exist_ok=True)
+
     # 1. Prepare Model
     download_model_if_needed()
 
+    if WHISPER_AUDIO_INPUT == "pipe" and WHISPER_BACKEND != "server":
+        start = time.time()
+        transcript = run_whisper_piped(audio_path, output_base, label, threads)
+        if transcript:
+            record_transcription(label, chunking.media_duration(audio_path), time.time() - start)
+            finish_transcript(audio_path, transcript)
+        return transcript
+
     # 2. Convert Audio
     print(f"Converting {audio_path} to 16kHz WAV...")
     wav_path, created_temp = convert_to_wav_16k(audio_path)
@@ -102,28 +243,237 @@ def transcribe(audio_path):
         return None
 
     # 3. Run Whisper
-    print(f"Transcribing {rel_path}...")
-    
-    # whisper.cpp executable path
-    executable = WHISPER_BIN
-    
-    cmd = [
-        executable,
-        "-m", WHISPER_MODEL_PATH,
-        "-f", wav_path,
-        "-l", "auto",      # auto-detect language
-        "-otxt",           # output text file
-        "-of", output_base # output file prefix
-    ]
-    
+    whisper_wav = wav_path
     try:
-        subprocess.run(cmd, check=True)
-        print(f"Transcription complete: {expected_output}")
-        return expected_output
-    except subprocess.CalledProcessError as e:
+        duration = wav_duration(wav_path)
+        start = time.time()
+        spans = None
+        if WHISPER_TRIM_SILENCE and duration:
+            whisper_wav, spans = trim_silence(wav_path, duration, label)
+        whisper_duration = chunking.wav_duration(whisper_wav) if spans else duration
+        transcript = run_whisper_wav(whisper_wav, output_base, label, whisper_duration, threads)
+        if transcript:
+            if spans and WHISPER_SEGMENTS and os.path.exists(output_base + ".seg"):
+                segments.remap(output_base + ".seg", chunking.original_timeline(spans))
+            record_transcription(label, duration, time.time() - start)
+            finish_transcript(audio_path, transcript)
+        return transcript
+    except (subprocess.CalledProcessError, wave.Error, EOFError, OSError) as e:
         print(f"Whisper failed: {e}")
         return None
     finally:
         # Cleanup temporary wav file ONLY if we created it
         if created_temp and os.path.exists(wav_path):
             os.remove(wav_path)
+        if whisper_wav != wav_path and os.path.exists(whisper_wav):
+            os.remove(whisper_wav)
+
+def wav_duration(wav_path):
+    """
+    Duration of a converted WAV in seconds, from its header, or from ffprobe
+    if the wave module can't read it. None if it can't be determined.
+    """
+    try:
+        return chunking.wav_duration(wav_path)
+    except (wave.Error, EOFError, OSError) as e:
+        print(f"Warning: Could not read the WAV header of {wav_path}: {e}")
+        return chunking.media_duration(wav_path)
+
+def trim_silence(wav_path, duration, label):
+    """
+    Writes wav_path without its long silences to a new WAV for whisper.
+    Returns (path, kept spans), or (wav_path, None) if nothing is left out.
+    """
+    try:
+        silences = chunking.detect_silences(wav_path, WHISPER_TRIM_SILENCE_DB, WHISPER_TRIM_MIN_SILENCE)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Warning: Silence detection failed, transcribing everything: {e}")
+        return wav_path, None
+
+    spans = chunking.speech_spans(duration, silences, WHISPER_TRIM_PADDING)
+    skipped = duration - sum(end - start for start, end in spans) if spans else 0.0
+    record_trim(label, duration, skipped)
+    if skipped < 1:
+        return wav_path, None
+
+    trimmed_path = os.path.splitext(wav_path)[0] + ".trimmed.wav"
+    try:
+        chunking.keep_spans(wav_path, spans, trimmed_path)
+    except (wave.Error, EOFError, OSError) as e:
+        print(f"Warning: Could not trim silence, transcribing everything: {e}")
+        if os.path.exists(trimmed_path):
+            os.remove(trimmed_path)
+        return wav_path, None
+    print(f"✂️  Leaving out {skipped:.0f}s of silence ({skipped / duration:.0%}) of {label}")
+    return trimmed_path, spans
+
+def record_trim(label, audio_seconds, skipped_seconds):
+    """
+    Records how much of an episode was left out as silence, per podcast.
+    """
+    podcast = label.split(os.sep, 1)[0] if os.sep in label else "unknown"
+    metrics.inc("podgist_trim_audio_seconds_total", audio_seconds, podcast=podcast)
+    metrics.inc("podgist_trim_skipped_seconds_total", skipped_seconds, podcast=podcast)
+    metrics.log_event(
+        "silence_trim",
+        episode=label,
+        podcast=podcast,
+        audio_seconds=round(audio_seconds, 1),
+        skipped_seconds=round(skipped_seconds, 1),
+        skipped_ratio=round(skipped_seconds / audio_seconds, 4) if audio_seconds else None
+    )
+
+def finish_transcript(audio_path, transcript):
+    """
+    Records what produced a new transcript and accounts for it in storage.
+    The audio can be evicted from now on.
+    """
+    provenance.record(transcript, model=WHISPER_MODEL)
+    base = transcript[:-len(".txt")]
+    storage.add(transcript, base + ".seg", provenance.meta_path(transcript))
+    storage.release_audio(audio_path)
+
+def run_whisper_wav(wav_path, output_base, label, duration, threads):
+    """
+    Runs whisper on a 16kHz WAV with the configured backend.
+    Returns the transcript path or None.
+    """
+    expected_output = output_base + ".txt"
+    if WHISPER_BACKEND == "server":
+        transcript = run_whisper_server(wav_path, output_base, label, threads)
+        if transcript:
+            return transcript
+
+    if WHISPER_CHUNKS > 1 and duration and duration >= WHISPER_CHUNK_MIN_DURATION:
+        return run_whisper_chunked(wav_path, output_base, label, duration, threads)
+
+    print(f"Transcribing {label}...")
+    subprocess.run(whisper_command(wav_path, output_base, threads), check=True)
+    save_segments(output_base, [(output_base, 0.0)])
+    print(f"Transcription complete: {expected_output}")
+    return expected_output
+
+def record_transcription(label, audio_seconds, whisper_seconds):
+    """
+    Records whisper time against audio duration (the real-time factor).
+    """
+    metrics.observe("podgist_whisper_seconds", whisper_seconds)
+    rtf = None
+    if audio_seconds:
+        rtf = whisper_seconds / audio_seconds
+        metrics.inc("podgist_audio_seconds_total", audio_seconds)
+        metrics.observe("podgist_transcribe_realtime_factor", rtf)
+    metrics.log_event(
+        "transcribe",
+        episode=label,
+        audio_seconds=round(audio_seconds, 1) if audio_seconds else None,
+        whisper_seconds=round(whisper_seconds, 3),
+        realtime_factor=round(rtf, 4) if rtf is not None else None
+    )
+
+def run_whisper_piped(audio_path, output_base, label, threads):
+    """
+    Decodes audio_path with ffmpeg straight into whisper-cli's stdin, so no
+    WAV is written to disk and decoding overlaps with the model load.
+    Returns the transcript path or None.
+    """
+    expected_output = output_base + ".txt"
+    print(f"Transcribing {label} (piped from ffmpeg)...")
+
+    ffmpeg = subprocess.Popen(
+        ffmpeg_command(audio_path, "-"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        whisper = subprocess.run(whisper_command("-", output_base, threads), stdin=ffmpeg.stdout)
+    finally:
+        ffmpeg.stdout.close()
+        ffmpeg.wait()
+
+    if ffmpeg.returncode != 0:
+        print(f"FFmpeg conversion failed with exit code {ffmpeg.returncode}")
+        return None
+    if whisper.returncode != 0:
+        print(f"Whisper failed with exit code {whisper.returncode}")
+        return None
+    save_segments(output_base, [(output_base, 0.0)])
+    print(f"Transcription complete: {expected_output}")
+    return expected_output
+
+def run_whisper_chunked(wav_path, output_base, label, duration, threads):
+    """
+    Splits a long WAV at silences into WHISPER_CHUNKS pieces, transcribes
+    them in parallel whisper-cli processes and stitches the text back
+    together in order. Threads are split so all processes together use
+    the available cores.
+    Returns the transcript path or None.
+    """
+    expected_output = output_base + ".txt"
+
+    silences = chunking.detect_silences(wav_path, WHISPER_SILENCE_DB, WHISPER_SILENCE_MIN_DURATION)
+    chunks = chunking.plan_chunks(duration, silences, WHISPER_CHUNKS)
+    threads = max(1, threads // len(chunks))
+    print(f"Transcribing {label} in {len(chunks)} chunks ({threads} threads each)...")
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(wav_path)) as tmp_dir:
+        # All chunks are cut before any whisper starts, so a failed cut
+        # leaves no process behind
+        bases = [os.path.join(tmp_dir, str(i)) for i in range(len(chunks))]
+        for base, (start, end) in zip(bases, chunks):
+            chunking.cut_wav(wav_path, start, end, base + ".wav")
+
+        processes = []
+        try:
+            for base in bases:
+                processes.append(subprocess.Popen(
+                    whisper_command(base + ".wav", base, threads),
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                ))
+            failed = [i for i, p in enumerate(processes) if p.wait() != 0]
+        except BaseException:
+            # Don't leave whisper running on a deleted temporary directory
+            for p in processes:
+                p.kill()
+                p.wait()
+            raise
+        if failed:
+            print(f"Whisper failed on chunks {failed}")
+            return None
+
+        texts = []
+        for base in bases:
+            with open(base + ".txt", "r", encoding="utf-8") as f:
+                texts.append(f.read())
+        # Chunk timestamps are shifted back onto the episode's timeline
+        save_segments(output_base, [(base, start) for base, (start, _) in zip(bases, chunks)])
+
+    with open(expected_output, "w", encoding="utf-8") as f:
+        f.write(chunking.stitch(texts))
+    print(f"Transcription complete: {expected_output}")
+    return expected_output
+
+def run_whisper_server(wav_path, output_base, label, threads):
+    """
+    Transcribes wav_path on a persistent whisper server, which keeps the
+    model loaded between episodes.
+    Returns the transcript path, or None if no server could be started so
+    the caller falls back to whisper-cli.
+    """
+    expected_output = output_base + ".txt"
+    print(f"Transcribing {label} (whisper server)...")
+    try:
+        result = transcribe_with_server(wav_path, threads, verbose=WHISPER_SEGMENTS)
+    except (OSError, RuntimeError) as e:
+        print(f"Whisper server unavailable, falling back to whisper-cli: {e}")
+        return None
+
+    text = result
+    if WHISPER_SEGMENTS:
+        text = result.get("text", "")
+        segments.write_segments(output_base + ".seg", segments.parse_verbose_json(result))
+    with open(expected_output, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"Transcription complete: {expected_output}")
+    return expected_output
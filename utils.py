@@ -1,7 +1,36 @@
 from datetime import datetime
-import requests
-import xml.etree.ElementTree as ET
-import re
+import os
+from feed_cache import lookup_episode
+from config import MIN_PLAY_PROGRESS
+
+_templates = {}
+
+def read_template(path):
+    """
+    Returns the contents of a prompt template, read from disk only when the
+    file changed since the last call. Returns None if it can't be read.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        print(f"Prompt file not found: {path}")
+        return None
+
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _templates.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            template = f.read()
+    except OSError as e:
+        print(f"Error reading prompt file: {e}")
+        return None
+    if cached:
+        print(f"🔄 Reloaded prompt template {path}")
+    _templates[path] = (stamp, template)
+    return template
 
 def sanitize_filename(name):
     """
@@ -20,73 +49,43 @@ def get_podcast_metadata(podcast_url, episode_url):
     Returns (podcast_title, episode_title).
     """
     try:
-        # Some feeds might require a User-Agent
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (PodGist/1.0)'
-        }
-        resp = requests.get(podcast_url, headers=headers, timeout=30)
-        resp.raise_for_status()
-        
-        # Parse XML
-        # We use fromstring which parses bytes or string
-        root = ET.fromstring(resp.content)
-        
-        # Handle cases where root is rss/channel or just channel
-        channel = root.find('channel')
-        if channel is None:
-            # Maybe the root IS the channel (Atom? or just weird RSS)
-            # Standard RSS is <rss><channel>...</channel></rss>
-            # Check if root tag is channel?
-            if root.tag == 'channel':
-                channel = root
-            else:
-                # Fallback, maybe look for title in root (Atom)
-                # But let's stick to standard RSS structure primarily
-                pass
-
-        podcast_title = "Unknown Podcast"
-        if channel is not None:
-            t = channel.findtext('title')
-            if t:
-                podcast_title = t
-
-        episode_title = "Unknown Episode"
-        
-        # Iterate items to find episode
-        # Support both 'item' (RSS) and 'entry' (Atom - though structure differs)
-        items = channel.findall('item') if channel is not None else []
-        
-        found = False
-        for item in items:
-            # Check enclosure url
-            enclosure = item.find('enclosure')
-            if enclosure is not None:
-                url = enclosure.get('url')
-                # Simple check: exact match or contained
-                # Often episode_url might have extra params
-                if url and (url == episode_url or episode_url in url or url in episode_url):
-                    episode_title = item.findtext('title')
-                    found = True
-                    break
-            
-            # Check guid
-            guid = item.findtext('guid')
-            if guid and guid == episode_url:
-                 episode_title = item.findtext('title')
-                 found = True
-                 break
-
-        if not found and channel is not None:
-             # Try to see if we can match by just filename if urls are vastly different
-             # This is risky but helpful
-             pass
-
-        return podcast_title, episode_title
+        podcast_title, episode_title = lookup_episode(podcast_url, episode_url)
+        return podcast_title, episode_title or "Unknown Episode"
 
     except Exception as e:
         print(f"Error fetching metadata for {podcast_url}: {e}")
         return None, None
 
+def build_relative_path(podcast_url, episode_url):
+    """
+    Builds the "<podcast>/<episode>.mp3" path used to store an episode,
+    based on the titles found in the podcast's RSS feed.
+    """
+    podcast_title, episode_title = get_podcast_metadata(podcast_url, episode_url)
+    return titles_to_relative_path(podcast_title, episode_title, episode_url)
+
+def titles_to_relative_path(podcast_title, episode_title, episode_url):
+    """
+    Builds the storage path from already known titles, falling back to the
+    episode URL's filename.
+    """
+    if not podcast_title:
+        podcast_title = "Unknown Podcast"
+    if not episode_title:
+        # fallback to extracting from URL
+        episode_title = episode_url.split("/")[-1]
+        if "?" in episode_title:
+            episode_title = episode_title.split("?")[0]
+
+    safe_podcast = sanitize_filename(podcast_title)
+    safe_episode = sanitize_filename(episode_title)
+
+    # Ensure extension
+    if not safe_episode.lower().endswith('.mp3') and not safe_episode.lower().endswith('.m4a'):
+        safe_episode += ".mp3" # default guess
+
+    return os.path.join(safe_podcast, safe_episode)
+
 def parse_timestamp(ts):
     if ts is None:
         return None
@@ -103,3 +102,36 @@ def parse_timestamp(ts):
             return None
 
     return None
+
+def coalesce_plays(actions):
+    """
+    Reduces a batch of episode actions to the latest play per episode and
+    device, in a single pass. gPodder records a play on every pause and
+    resume, so the same episode often appears many times in one batch.
+    Returns a list of (datetime, action) tuples, in no particular order.
+    """
+    latest = {}
+    for action in actions:
+        if action.get("action") != "play":
+            continue
+        dt = parse_timestamp(action.get("timestamp"))
+        # The raw URL: episodes of some hosts only differ in the query string
+        key = ((action.get("episode") or "").strip(), action.get("device"))
+        current = latest.get(key)
+        if current is None or (dt or datetime.min) >= (current[0] or datetime.min):
+            latest[key] = (dt, action)
+    return list(latest.values())
+
+def barely_started(action):
+    """
+    True if less than MIN_PLAY_PROGRESS of the episode was played
+    (position/total), e.g. a short sample. Always False if disabled or
+    the total is unknown.
+    """
+    if not MIN_PLAY_PROGRESS:
+        return False
+    try:
+        position, total = float(action.get("position")), float(action.get("total"))
+    except (TypeError, ValueError):
+        return False
+    return total > 0 and position / total < MIN_PLAY_PROGRESS
@@ -0,0 +1,151 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import subprocess
+import requests
+from http_client import get_session
+from config import (
+    WHISPER_MODEL_PATH,
+    WHISPER_SERVER_BIN,
+    WHISPER_SERVER_HOST,
+    WHISPER_SERVER_PORT,
+    WHISPER_SERVER_STARTUP_TIMEOUT,
+    PIPELINE_TRANSCRIBE_WORKERS
+)
+
+class WhisperServer:
+    """
+    A whisper.cpp server process that keeps the model loaded between jobs.
+    It is (re)started on demand, so a crashed server is replaced by the
+    next job.
+    """
+
+    def __init__(self, port, threads):
+        self.port = port
+        self.threads = threads
+        self.process = None
+        self.url = f"http://{WHISPER_SERVER_HOST}:{port}"
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        if not os.path.exists(WHISPER_SERVER_BIN):
+            raise FileNotFoundError(f"whisper-server not found at {WHISPER_SERVER_BIN}")
+
+        print(f"Starting whisper server on port {self.port}...")
+        self.process = subprocess.Popen(
+            [
+                WHISPER_SERVER_BIN,
+                "-m", WHISPER_MODEL_PATH,
+                "--host", WHISPER_SERVER_HOST,
+                "--port", str(self.port),
+                "-t", str(self.threads),
+                "-l", "auto"
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        # Wait until the model is loaded and the server answers
+        deadline = time.time() + WHISPER_SERVER_STARTUP_TIMEOUT
+        while time.time() < deadline:
+            if not self.alive():
+                raise RuntimeError(f"whisper server exited with code {self.process.returncode}")
+            try:
+                get_session().get(self.url, timeout=2)
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.5)
+        self.stop()
+        raise TimeoutError(f"whisper server did not start within {WHISPER_SERVER_STARTUP_TIMEOUT}s")
+
+    def stop(self):
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def _inference(self, wav_path, verbose):
+        with open(wav_path, 'rb') as f:
+            resp = get_session().post(
+                f"{self.url}/inference",
+                files={"file": (os.path.basename(wav_path), f, "audio/wav")},
+                data={"response_format": "verbose_json" if verbose else "text"},
+                timeout=(10, None)
+            )
+        resp.raise_for_status()
+        return resp.json() if verbose else resp.text
+
+    def transcribe(self, wav_path, verbose=False):
+        """
+        Transcribes a 16kHz WAV file and returns the text, or with verbose
+        the verbose_json response including the segments.
+        If the server died or drops the connection, it is restarted and the
+        job is tried once more.
+        """
+        if not self.alive():
+            self.start()
+        try:
+            return self._inference(wav_path, verbose)
+        except requests.exceptions.ConnectionError:
+            print(f"Whisper server on port {self.port} crashed, restarting...")
+            self.stop()
+            self.start()
+            return self._inference(wav_path, verbose)
+
+_pool = None
+_servers = []
+_pool_lock = threading.Lock()
+# Ports and number of servers of this process's pool
+_first_port = WHISPER_SERVER_PORT
+_pool_size = PIPELINE_TRANSCRIBE_WORKERS
+
+def configure_pool(first_port, size):
+    """
+    Sets the ports (first_port onwards) and number of servers, before the
+    first transcription. Lets a second process, like a backfill next to the
+    running service, use its own servers.
+    """
+    global _first_port, _pool_size
+    with _pool_lock:
+        if _pool is not None:
+            raise RuntimeError("whisper server pool already started")
+        _first_port, _pool_size = first_port, size
+
+def _get_pool(threads):
+    """
+    Returns a queue of servers, one per transcription worker, on
+    consecutive ports.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = queue.Queue()
+            for i in range(max(1, _pool_size)):
+                server = WhisperServer(_first_port + i, threads)
+                _servers.append(server)
+                _pool.put(server)
+    return _pool
+
+def transcribe_with_server(wav_path, threads, verbose=False):
+    """
+    Transcribes wav_path on a free server from the pool and returns the
+    text (see WhisperServer.transcribe).
+    """
+    pool = _get_pool(threads)
+    server = pool.get()
+    try:
+        return server.transcribe(wav_path, verbose)
+    finally:
+        pool.put(server)
+
+@atexit.register
+def stop_servers():
+    for server in _servers:
+        server.stop()